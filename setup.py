@@ -38,6 +38,15 @@ setup(
             "spotzurnal-rematch = spotzurnal.main:rematch",
             "spotzurnal-quirkgen = spotzurnal.quirkgen:quirkgen",
             "spotzurnal-aggregator = spotzurnal.aggregator:aggregator",
+            "spotzurnal-plan = spotzurnal.plan:plan",
+            "spotzurnal-apply = spotzurnal.plan:apply",
+            "spotzurnal-plan-export = spotzurnal.plan:export",
+            "spotzurnal-revalidate = spotzurnal.revalidate:revalidate",
+            "spotzurnal-cache-export = spotzurnal.snapshot:export",
+            "spotzurnal-cache-import = spotzurnal.snapshot:import_",
+            "spotzurnal-ingest = spotzurnal.ingest:ingest",
+            "spotzurnal-warmup = spotzurnal.warmup:warmup",
+            "spotzurnal-cache = spotzurnal.maintenance:cache",
         ],
     },
 )
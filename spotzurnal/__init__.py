@@ -2,5 +2,7 @@ from .spotify import Spotify
 from .cache import Cache
 from . import croapi
 from . import matcher
+from . import records
+from . import aio
 
-__all__ = [Spotify, Cache, croapi, matcher]
+__all__ = [Spotify, Cache, croapi, matcher, records, aio]
@@ -5,14 +5,18 @@ from collections import namedtuple, defaultdict
 import click
 
 from . import croapi
+from . import profiling
 from .spotify import Spotify
+from .cache import Cache
 from .clickdate import ClickDate
 
+Playlist = namedtuple("Playlist", "station, date, id, snapshot_id")
+
 
 def parse_plname(spoplaylist):
     """
     Parse Spotify playlist object name into tuple containing station
-    and date.
+    and date, together with the playlist id and snapshot id.
     """
     mnum = {
         "ledna": 1, "února": 2, "března": 3, "dubna": 4, "května": 5,
@@ -26,8 +30,8 @@ def parse_plname(spoplaylist):
         y = int(y)
         date = datetime.date(y, m, d)
         station = croapi.get_cro_station_id(" ".join(s))
-        return namedtuple("Playlist", "station, date, id")(
-            station, date, spoplaylist["id"],
+        return Playlist(
+            station, date, spoplaylist["id"], spoplaylist.get("snapshot_id"),
         )
     except ValueError:
         pass
@@ -45,7 +49,34 @@ def get_plname(station, month):
     )
 
 
-def do_aggregate(sp, playlists, month, station, mintracks):
+def get_playlist_tracks(sp, playlist, cache=None):
+    """
+    Return track ids of a playlist. With a cache, the content is
+    downloaded only if the snapshot id of the playlist has changed.
+    """
+    if cache:
+        trackids = cache.lookup_playlist_tracks(
+            playlist.id, playlist.snapshot_id,
+        )
+        if trackids is not None:
+            return trackids
+    trackids = [
+        t["track"]["id"]
+        for t in sp.get_all_data(
+            sp.user_playlist_tracks,
+            sp.user,
+            playlist.id,
+            fields="next,items(track(id))",
+        )
+    ]
+    if cache and playlist.snapshot_id:
+        cache.store_playlist_tracks(
+            playlist.id, playlist.snapshot_id, trackids,
+        )
+    return trackids
+
+
+def do_aggregate(sp, playlists, month, station, mintracks, cache=None):
     playlists = [
         p for p in playlists
         if p
@@ -56,13 +87,8 @@ def do_aggregate(sp, playlists, month, station, mintracks):
     counts = defaultdict(int)
     for p in playlists:
         print(f"Processing playlist from {p.date:%Y-%m-%d}")
-        for t in sp.get_all_data(
-            sp.user_playlist_tracks,
-            sp.user,
-            p.id,
-            fields="next,items(track(id))",
-        ):
-            counts[t["track"]["id"]] += 1
+        for t in get_playlist_tracks(sp, p, cache):
+            counts[t] += 1
     print()
     rating = defaultdict(list)
     for trackid, rate in counts.items():
@@ -134,15 +160,27 @@ def do_aggregate(sp, playlists, month, station, mintracks):
     show_default=True,
     help="Minimum number of tracks in the output playlist",
 )
-def aggregator(credentials, username, month, station, mintracks):
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache. (Created if necessary)",
+)
+@profiling.profile_options
+def aggregator(credentials, username, month, station, mintracks, cache):
     """
     Aggregate the most popular songs from daily playlists into a new playlist.
     """
     sp = Spotify(username=username, credfile=credentials)
+    c = Cache(cache)
     playlists = [
         parse_plname(p)
         for p in sp.get_all_data(sp.current_user_playlists, limit=50)
     ]
     for s in station:
-        do_aggregate(sp, playlists, month, s, mintracks)
+        with profiling.section(f"{s}-{month:%Y-%m}"):
+            do_aggregate(sp, playlists, month, s, mintracks, c)
+        c.flush_counters()
         print()
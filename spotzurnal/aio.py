@@ -0,0 +1,199 @@
+"""
+Asynchronous API for embedding the matcher in asyncio applications.
+
+The CRo client, Spotify client and cache are blocking, so their calls run
+in the default executor of the event loop. The number of calls running at
+once is limited per event loop by semaphores, so waiting requests hold no
+threads. Progress messages are returned in the results instead of being
+printed.
+"""
+import asyncio
+import weakref
+import functools
+
+from . import croapi
+from . import matcher
+from .cache import Cache
+
+# Default numbers of concurrent calls per event loop: CRo API downloads,
+# Spotify searches (including the check of candidates against the cache),
+# other cache reads and writes, and Spotify playlist writes
+LIMITS = {
+    "cro": 4,
+    "search": 8,
+    "cache": 4,
+    "write": 1,
+}
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_limits(**limits):
+    """
+    Change limits of concurrent `cro`, `search`, `cache` and `write`
+    calls. Takes effect for event loops that have not used the API yet.
+    """
+    unknown = set(limits) - set(LIMITS)
+    if unknown:
+        raise ValueError(f"Unknown limits: {', '.join(sorted(unknown))}")
+    LIMITS.update(limits)
+
+
+def _get_semaphores():
+    loop = asyncio.get_event_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = {
+            k: asyncio.Semaphore(v) for k, v in LIMITS.items()
+        }
+    return _semaphores[loop]
+
+
+async def _run(limit, func, *args, **kwargs):
+    """Run a blocking function in the executor within a limit."""
+    loop = asyncio.get_event_loop()
+    async with _get_semaphores()[limit]:
+        return await loop.run_in_executor(
+            None, functools.partial(func, *args, **kwargs),
+        )
+
+
+def _collector(messages):
+    def log(text="", **style):
+        messages.append((text, style))
+    return log
+
+
+async def get_cro_day_playlist(station="radiozurnal", date=None):
+    """Download the playlist from CRo API for a day."""
+    return await _run(
+        "cro",
+        lambda: list(croapi.get_cro_day_playlist(station, date)),
+    )
+
+
+async def search_spotify_track(sp, croartist, crotitle, cache=None):
+    """
+    Do a Spotify search for a track of an artist. Return tuple of the
+    track (None if not found) and list of progress messages. With `cache`,
+    tracks known to be unplayable are skipped.
+    """
+    messages = []
+    t = await _run(
+        "search",
+        matcher.search_spotify_track,
+        sp, croartist, crotitle, _collector(messages), cache,
+    )
+    return t, messages
+
+
+async def plan_cro_playlist(sp, date, station, cache=None, quirks=None):
+    """
+    Match a playlist published by the Czech Radio to Spotify tracks and
+    store the result as a plan in the cache. Tracks are matched
+    concurrently. Return MatchResult.
+    """
+    c = cache or Cache()
+    q = quirks or {"artists": {}, "tracks": {}}
+    items = await get_cro_day_playlist(station, date)
+    await _run("cache", c.store_plays, station, items)
+
+    async def match(track):
+        messages = []
+        log = _collector(messages)
+        m = await _run("cache", matcher.lookup_track, track, c, q, log)
+        if m:
+            return (m, True), messages
+        log(f"{track.since:%H:%M}: {track.interpret} - {track.track}")
+        interpret = (
+            matcher.get_artist_quirk(q, track.interpret_id, log)
+            or track.interpret
+        )
+        t = await _run(
+            "search",
+            matcher.search_spotify_track,
+            sp, interpret, track.track, log, c,
+        )
+        m = await _run(
+            "cache",
+            matcher.store_search_result,
+            track, interpret, t, c,
+        )
+        return (m, False), messages
+
+    # Repeated plays of a track would all miss the cache at once, so each
+    # track is matched only once
+    unique = {}
+    for t in items:
+        unique.setdefault(t.track_id, t)
+    results = await asyncio.gather(*(match(t) for t in unique.values()))
+    messages = [m for _, msgs in results for m in msgs]
+    first = dict(zip(unique, (m for m, _ in results)))
+    matches, seen = [], set()
+    for t in items:
+        trackid, cached = first[t.track_id]
+        if t.track_id in seen:
+            # Repeated play, a cache hit for the sequential matcher
+            cached = cached or trackid is not None
+        seen.add(t.track_id)
+        matches.append((trackid, cached))
+    result = await _run(
+        "cache",
+        matcher.store_match_result,
+        c, station, date, items, matches,
+    )
+    matcher.report_match_result(result, _collector(messages))
+    return result._replace(messages=messages)
+
+
+async def apply_playlist(
+        sp, date, station, trackids, replace=False, cache=None, index=None,
+):
+    """
+    Write matched Spotify track ids to the playlist of a station-day.
+    Return tuple of the playlist id and list of progress messages.
+    `index` is an optional playlist name index as in
+    matcher.apply_playlist().
+    """
+    messages = []
+    playlist = await _run(
+        "write",
+        matcher.apply_playlist,
+        sp, date, station, trackids, replace, index, _collector(messages),
+        cache,
+    )
+    return playlist, messages
+
+
+async def match_cro_playlist(
+        sp, date, station, replace=False, cache=None, quirks=None,
+        indexes=None,
+):
+    """
+    Generate a Spotify playlist from a playlist published by the Czech
+    Radio. `sp` can also be a list of Spotify clients, the playlist is then
+    matched using the first one and written to all of them. `indexes` is
+    an optional dictionary of playlist name indexes per user, filled in
+    on first use.
+
+    Return tuple of MatchResult and dictionary mapping user names to
+    playlist ids.
+    """
+    c = cache or Cache()
+    accounts = sp if isinstance(sp, list) else [sp]
+    result = await plan_cro_playlist(accounts[0], date, station, c, quirks)
+    playlists = {}
+    for a in accounts:
+        if result.trackids:
+            index = None
+            if indexes is not None:
+                if a.user not in indexes:
+                    indexes[a.user] = await _run(
+                        "write", a.get_playlist_index,
+                    )
+                index = indexes[a.user]
+            playlists[a.user], messages = await apply_playlist(
+                a, date, station, result.trackids, replace, c, index,
+            )
+            result.messages.extend(messages)
+        await _run("cache", c.mark_plan_applied, station, date, a.user)
+    return result, playlists
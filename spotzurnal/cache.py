@@ -1,15 +1,78 @@
+import os
+import time
 import sqlite3
-from collections import namedtuple
+import datetime
+import tempfile
+import threading
+from pathlib import Path
+from collections import Counter
 
 from click import secho
 
+from .records import Track, Interpret
+
+# Tables and columns shared among hosts by cache snapshots
+SNAPSHOT_TABLES = {
+    "cro_interprets": ("interpret_id", "interpret"),
+    "cro_tracks": ("track_id", "track", "interpret_id"),
+    "spo_artists": ("artist_id", "artist"),
+    "spo_tracks": ("track_id", "track"),
+    "spo_tracks_artists": ("track_id", "artist_id"),
+    "cro_spo_artists": ("interpret_id", "artist_id"),
+    # Statuses go before matches, so that imported matches are checked
+    # against them
+    "spo_track_status": ("track_id", "playable", "relinked_id", "checked"),
+    "cro_spo_tracks": ("cro_track_id", "spo_track_id", "matched"),
+}
+
 
 class Cache:
+    """
+    SQLite cache of CRo tracks, Spotify tracks and their matches.
+
+    Each thread (and each process) gets its own database connection, so
+    one Cache object can be shared among workers.
+    """
+
     def __init__(self, dbfile=":memory:"):
-        self.con = sqlite3.connect(dbfile)
-        self.con.row_factory = sqlite3.Row
+        if dbfile == ":memory:":
+            # A private temporary file instead of a real in-memory database,
+            # so that it can be opened by more connections at once.
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="spotzurnal-")
+            dbfile = Path(self._tmpdir.name) / "cache.sqlite"
+        self.dbfile = str(dbfile)
+        self._local = threading.local()
+        self._counters = Counter()
+        self._counters_lock = threading.Lock()
+        # Takes effect only for a new database, allows online compaction
+        self.con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        with self.con:
+            self.con.execute("PRAGMA journal_mode=WAL")
         self.create_tables()
 
+    def __getstate__(self):
+        if hasattr(self, "_tmpdir"):
+            raise TypeError("Temporary cache cannot be shared by processes")
+        return {"dbfile": self.dbfile}
+
+    def __setstate__(self, state):
+        self.__init__(state["dbfile"])
+
+    def connect(self):
+        """Return a new connection to the cache database."""
+        con = sqlite3.connect(self.dbfile, timeout=60)
+        con.row_factory = sqlite3.Row
+        return con
+
+    @property
+    def con(self):
+        """Connection of the current thread in the current process."""
+        pid, con = getattr(self._local, "con", (None, None))
+        if pid != os.getpid():
+            con = self.connect()
+            self._local.con = (os.getpid(), con)
+        return con
+
     def create_tables(self):
         with self.con:
             self.con.execute("""CREATE TABLE IF NOT EXISTS cro_interprets
@@ -38,10 +101,89 @@ class Cache:
                     )""")
             self.con.execute("""CREATE TABLE IF NOT EXISTS cro_spo_tracks
                     (cro_track_id INT PRIMARY KEY,
-                     spo_track_id TEXT
+                     spo_track_id TEXT,
+                     matched REAL
+                    )""")
+            self.add_column("cro_spo_tracks", "matched", "REAL")
+            self.con.execute("""CREATE INDEX IF NOT EXISTS cro_spo_tracks_spo
+                    ON cro_spo_tracks(spo_track_id)""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS spo_track_status
+                    (track_id TEXT PRIMARY KEY,
+                     playable INT,
+                     relinked_id TEXT,
+                     checked REAL
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS research_queue
+                    (cro_track_id INT PRIMARY KEY,
+                     spo_track_id TEXT,
+                     queued REAL
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS meta
+                    (key TEXT PRIMARY KEY,
+                     value
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS counters
+                    (name TEXT PRIMARY KEY,
+                     value INT
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS cro_unmatched
+                    (cro_track_id INT PRIMARY KEY,
+                     interpret TEXT,
+                     searched REAL
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS cro_plays
+                    (station TEXT,
+                     since TEXT,
+                     track_id INT,
+                     PRIMARY KEY(station, since)
+                    )""")
+            self.con.execute("""CREATE INDEX IF NOT EXISTS cro_plays_track
+                    ON cro_plays(track_id)""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS spo_playlists
+                    (playlist_id TEXT PRIMARY KEY,
+                     snapshot_id TEXT,
+                     updated REAL
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS spo_playlist_tracks
+                    (playlist_id TEXT,
+                     position INT,
+                     track_id TEXT,
+                     PRIMARY KEY(playlist_id, position)
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS playlist_plans
+                    (station TEXT,
+                     date TEXT,
+                     updated REAL,
+                     PRIMARY KEY(station, date)
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS playlist_plan_tracks
+                    (station TEXT,
+                     date TEXT,
+                     position INT,
+                     cro_track_id INT,
+                     spo_track_id TEXT,
+                     PRIMARY KEY(station, date, position)
+                    )""")
+            self.con.execute("""CREATE TABLE IF NOT EXISTS
+                    playlist_plan_applied
+                    (station TEXT,
+                     date TEXT,
+                     account TEXT,
+                     applied REAL,
+                     PRIMARY KEY(station, date, account)
                     )""")
 
-    def store_cro_track(self, track):
+    def add_column(self, table, column, decl):
+        """Add a column to a table created by an older version."""
+        columns = [
+            r[1] for r in self.con.execute(f"PRAGMA table_info({table})")
+        ]
+        if column not in columns:
+            self.con.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} {decl}",
+            )
+
+    def store_cro_track(self, track, log=secho):
         c = self.con.execute(
             "SELECT track_id, track, interpret_id, interpret "
             "FROM cro_tracks JOIN cro_interprets USING(interpret_id) "
@@ -55,7 +197,7 @@ class Cache:
             # Hard assertion on names fails regularly,
             # maybe some difflib could be used here.
             if track.track != t or track.interpret != i:
-                secho(
+                log(
                     f"{track.since:%H:%M}: {track.interpret} "
                     f"- {track.track}\n"
                     f"Cache: {i} - {t} ({iid} - {tid})",
@@ -72,54 +214,235 @@ class Cache:
                 (track.track_id, track.track, track.interpret_id),
             )
 
-    def store_spotify_track(self, spotrack, crotrack=None):
-        artists = [(a["id"], a["name"]) for a in spotrack["artists"]]
-        tracks_artists = [(spotrack["id"], a["id"])
-                          for a in spotrack["artists"]]
+    def store_cro_playlists(self, playlists):
+        """
+        Store CRo tracks and their plays in bulk, in a single transaction.
+        `playlists` is an iterable of (station, playlist items) tuples.
+        Names of already known tracks are not checked, items without track
+        or interpret id are skipped.
+        """
+        interprets, tracks, plays = [], [], []
+        for station, items in playlists:
+            for i in items:
+                if i.track_id is None or i.interpret_id is None:
+                    continue
+                interprets.append((i.interpret_id, i.interpret))
+                tracks.append((i.track_id, i.track, i.interpret_id))
+                plays.append((station, i.since.isoformat(), i.track_id))
         with self.con:
             self.con.executemany(
-                "INSERT OR IGNORE INTO spo_artists VALUES (?, ?)",
-                artists,
+                "INSERT OR IGNORE INTO cro_interprets VALUES (?, ?)",
+                interprets,
             )
-            self.con.execute(
-                "INSERT OR IGNORE INTO spo_tracks VALUES (?, ?)",
-                (spotrack["id"], spotrack["name"]),
+            self.con.executemany(
+                "INSERT OR IGNORE INTO cro_tracks VALUES (?, ?, ?)",
+                tracks,
             )
             self.con.executemany(
-                "INSERT OR IGNORE INTO spo_tracks_artists VALUES (?, ?)",
-                tracks_artists,
+                "INSERT OR IGNORE INTO cro_plays VALUES (?, ?, ?)",
+                plays,
             )
-        if crotrack:
-            cro_spo_artists = [(crotrack.interpret_id, a["id"])
-                               for a in spotrack["artists"]]
-            with self.con:
+        return len(plays)
+
+    def store_plays(self, station, items):
+        """Record plays of CRo playlist items on a station."""
+        with self.con:
+            self.con.executemany(
+                "INSERT OR IGNORE INTO cro_plays VALUES (?, ?, ?)",
+                (
+                    (station, i.since.isoformat(), i.track_id)
+                    for i in items
+                ),
+            )
+
+    def _insert_spotify_track(self, spotrack):
+        artists = [(a["id"], a["name"]) for a in spotrack["artists"]]
+        tracks_artists = [(spotrack["id"], a["id"])
+                          for a in spotrack["artists"]]
+        self.con.executemany(
+            "INSERT OR IGNORE INTO spo_artists VALUES (?, ?)",
+            artists,
+        )
+        self.con.execute(
+            "INSERT OR IGNORE INTO spo_tracks VALUES (?, ?)",
+            (spotrack["id"], spotrack["name"]),
+        )
+        self.con.executemany(
+            "INSERT OR IGNORE INTO spo_tracks_artists VALUES (?, ?)",
+            tracks_artists,
+        )
+
+    def store_spotify_track(self, spotrack, crotrack=None):
+        # A single transaction, so that prune_orphans() running in another
+        # process never sees the track before its match
+        with self.con:
+            self._insert_spotify_track(spotrack)
+            if crotrack:
+                cro_spo_artists = [(crotrack.interpret_id, a["id"])
+                                   for a in spotrack["artists"]]
                 self.con.executemany(
                     "INSERT OR IGNORE INTO cro_spo_artists VALUES (?, ?)",
                     cro_spo_artists,
                 )
                 self.con.execute(
-                    "INSERT OR IGNORE INTO cro_spo_tracks VALUES (?, ?)",
-                    (crotrack.track_id, spotrack["id"]),
+                    "INSERT OR IGNORE INTO cro_spo_tracks VALUES (?, ?, ?)",
+                    (crotrack.track_id, spotrack["id"], time.time()),
+                )
+                self.con.execute(
+                    "DELETE FROM cro_unmatched WHERE cro_track_id = ?",
+                    (crotrack.track_id,),
+                )
+                self.con.execute(
+                    "DELETE FROM research_queue WHERE cro_track_id = ?",
+                    (crotrack.track_id,),
                 )
 
+    def store_unmatched(self, track, interpret):
+        """
+        Remember that searching for a CRo track under an interpret name
+        has failed.
+        """
+        with self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO cro_unmatched VALUES (?, ?, ?)",
+                (track.track_id, interpret, time.time()),
+            )
+
+    def count(self, name):
+        """Increment a usage counter, see flush_counters()."""
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def flush_counters(self):
+        """Add usage counters collected in memory to the database."""
+        with self._counters_lock:
+            counters, self._counters = self._counters, Counter()
+        with self.con:
+            for name, value in counters.items():
+                self.con.execute(
+                    "INSERT OR IGNORE INTO counters VALUES (?, 0)",
+                    (name,),
+                )
+                self.con.execute(
+                    "UPDATE counters SET value = value + ? WHERE name = ?",
+                    (value, name),
+                )
+
+    def get_counters(self):
+        """Return dictionary of all usage counters."""
+        self.flush_counters()
+        return dict(
+            tuple(r) for r in self.con.execute("SELECT * FROM counters")
+        )
+
     def lookup_match(self, track):
         r = self.con.execute(
             "SELECT spo_track_id FROM cro_spo_tracks WHERE cro_track_id = ?",
             (track.track_id,),
         ).fetchone()
+        if r:
+            self.count("match_hit")
+            return r[0]
+        self.count("match_miss")
+
+    def get_meta(self, key, default=None):
+        r = self.con.execute(
+            "SELECT value FROM meta WHERE key = ?",
+            (key,),
+        ).fetchone()
         if r:
             return r[0]
+        return default
+
+    def set_meta(self, key, value):
+        with self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                (key, value),
+            )
 
-    def get_unmatched_tracks(self):
+    def get_matched_spotify_ids(self, after="", limit=50):
+        """
+        Return up to `limit` distinct Spotify track ids used in matches,
+        ordered and greater than `after`.
+        """
         r = self.con.execute(
-            "SELECT track_id, interpret_id, track, interpret "
+            "SELECT DISTINCT spo_track_id FROM cro_spo_tracks "
+            "WHERE spo_track_id > ? ORDER BY spo_track_id LIMIT ?",
+            (after, limit),
+        )
+        return [row[0] for row in r]
+
+    def store_track_status(
+            self, track_id, playable, relinked_id=None, relinked=None,
+    ):
+        """
+        Record availability of a matched Spotify track. Matches of
+        a relinked track are moved to the new track id, matches of an
+        unplayable track are removed and queued for a new search.
+        `relinked` is the new Spotify track, stored in the same transaction.
+        """
+        with self.con:
+            if relinked:
+                self._insert_spotify_track(relinked)
+            self.con.execute(
+                "INSERT OR REPLACE INTO spo_track_status VALUES (?, ?, ?, ?)",
+                (track_id, playable, relinked_id, time.time()),
+            )
+            if not playable:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO research_queue "
+                    "SELECT cro_track_id, spo_track_id, ? "
+                    "FROM cro_spo_tracks WHERE spo_track_id = ?",
+                    (time.time(), track_id),
+                )
+                self.con.execute(
+                    "DELETE FROM cro_spo_tracks WHERE spo_track_id = ?",
+                    (track_id,),
+                )
+            elif relinked_id and relinked_id != track_id:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO cro_spo_tracks "
+                    "SELECT cro_track_id, ?, ? "
+                    "FROM cro_spo_tracks WHERE spo_track_id = ?",
+                    (relinked_id, time.time(), track_id),
+                )
+
+    def get_unmatched_tracks(self, searched_before=None, queued_first=False):
+        """
+        Yield unmatched CRo tracks, the most played first. With
+        `searched_before`, skip tracks unsuccessfully searched for after
+        that timestamp. With `queued_first`, tracks from the re-search queue
+        come first.
+        """
+        r = self.con.execute(
+            "SELECT track_id, track, interpret_id, cro_interprets.interpret "
             "FROM cro_tracks JOIN cro_interprets USING(interpret_id) "
-            "LEFT JOIN cro_spo_tracks "
-            "ON track_id = cro_track_id "
-            "WHERE spo_track_id IS NULL",
+            "LEFT JOIN cro_spo_tracks AS m "
+            "ON track_id = m.cro_track_id "
+            "LEFT JOIN cro_unmatched AS u "
+            "ON track_id = u.cro_track_id "
+            "LEFT JOIN research_queue AS q "
+            "ON track_id = q.cro_track_id "
+            "LEFT JOIN (SELECT track_id, COUNT(*) AS plays "
+            "FROM cro_plays GROUP BY track_id) USING(track_id) "
+            "WHERE m.spo_track_id IS NULL "
+            "AND (?1 IS NULL OR u.searched IS NULL OR u.searched < ?1) "
+            "ORDER BY ?2 AND q.queued IS NOT NULL DESC, plays DESC, track_id",
+            (searched_before, queued_first),
         )
         for row in r:
-            yield namedtuple("Track", row.keys())(**row)
+            yield Track._make(row)
+
+    def get_unplayable(self, track_ids):
+        """Return set of the Spotify track ids known to be unplayable."""
+        track_ids = list(track_ids)
+        r = self.con.execute(
+            "SELECT track_id FROM spo_track_status WHERE playable = 0 "
+            f"AND track_id IN ({', '.join('?' * len(track_ids))})",
+            track_ids,
+        )
+        return {row[0] for row in r}
 
     def get_cro_track(self, track_id):
         r = self.con.execute(
@@ -128,7 +451,8 @@ class Cache:
             "WHERE track_id = ?",
             (track_id,),
         ).fetchone()
-        return namedtuple("Track", r.keys())(**r)
+        if r:
+            return Track._make(r)
 
     def get_cro_interpret(self, interpret_id):
         r = self.con.execute(
@@ -137,4 +461,452 @@ class Cache:
             "WHERE interpret_id = ?",
             (interpret_id,),
         ).fetchone()
-        return namedtuple("Interpret", r.keys())(**r)
+        if r:
+            return Interpret._make(r)
+
+    def lookup_playlist_tracks(self, playlist_id, snapshot_id):
+        """
+        Return list of track ids of a Spotify playlist if its content is
+        cached for the snapshot id, otherwise None.
+        """
+        if (
+            snapshot_id is None
+            or self.get_playlist_snapshot(playlist_id) != snapshot_id
+        ):
+            self.count("playlist_miss")
+            return None
+        self.count("playlist_hit")
+        r = self.con.execute(
+            "SELECT track_id FROM spo_playlist_tracks "
+            "WHERE playlist_id = ? ORDER BY position",
+            (playlist_id,),
+        )
+        return [row[0] for row in r]
+
+    def get_playlist_snapshot(self, playlist_id):
+        """Return cached snapshot id of a Spotify playlist."""
+        r = self.con.execute(
+            "SELECT snapshot_id FROM spo_playlists WHERE playlist_id = ?",
+            (playlist_id,),
+        ).fetchone()
+        if r:
+            return r[0]
+
+    def store_playlist_tracks(self, playlist_id, snapshot_id, trackids):
+        with self.con:
+            self.con.execute(
+                "DELETE FROM spo_playlist_tracks WHERE playlist_id = ?",
+                (playlist_id,),
+            )
+            self.con.execute(
+                "INSERT OR REPLACE INTO spo_playlists VALUES (?, ?, ?)",
+                (playlist_id, snapshot_id, time.time()),
+            )
+            self.con.executemany(
+                "INSERT INTO spo_playlist_tracks VALUES (?, ?, ?)",
+                ((playlist_id, n, t) for n, t in enumerate(trackids)),
+            )
+
+    def forget_playlist_tracks(self, playlist_id):
+        with self.con:
+            self.con.execute(
+                "DELETE FROM spo_playlists WHERE playlist_id = ?",
+                (playlist_id,),
+            )
+            self.con.execute(
+                "DELETE FROM spo_playlist_tracks WHERE playlist_id = ?",
+                (playlist_id,),
+            )
+
+    def store_plan(self, station, date, tracks):
+        """
+        Store planned content of a playlist for a station-day. `tracks` is
+        a list of (cro_track_id, spo_track_id) tuples, spo_track_id is None
+        for unmatched tracks. Return True if the plan has changed.
+        """
+        tracks = [(c, s) for c, s in tracks]
+        if self.get_plan(station, date) == tracks:
+            return False
+        d = date.isoformat()
+        with self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO playlist_plans VALUES (?, ?, ?)",
+                (station, d, time.time()),
+            )
+            self.con.execute(
+                "DELETE FROM playlist_plan_tracks "
+                "WHERE station = ? AND date = ?",
+                (station, d),
+            )
+            self.con.executemany(
+                "INSERT INTO playlist_plan_tracks VALUES (?, ?, ?, ?, ?)",
+                ((station, d, n, c, s) for n, (c, s) in enumerate(tracks)),
+            )
+        return True
+
+    def get_plan(self, station, date):
+        """Return list of (cro_track_id, spo_track_id) of a stored plan."""
+        r = self.con.execute(
+            "SELECT cro_track_id, spo_track_id FROM playlist_plan_tracks "
+            "WHERE station = ? AND date = ? ORDER BY position",
+            (station, date.isoformat()),
+        )
+        return [tuple(row) for row in r]
+
+    def get_plan_tracks(self, station, date):
+        """
+        Return rows of a stored plan including CRo track and interpret
+        names.
+        """
+        return self.con.execute(
+            "SELECT cro_track_id, interpret, track, spo_track_id "
+            "FROM playlist_plan_tracks "
+            "LEFT JOIN cro_tracks ON cro_track_id = track_id "
+            "LEFT JOIN cro_interprets USING(interpret_id) "
+            "WHERE station = ? AND date = ? ORDER BY position",
+            (station, date.isoformat()),
+        ).fetchall()
+
+    def get_plan_state(self, station, date):
+        """
+        Return rows of a stored plan together with the current state of
+        the cache for each track: (cro_track_id, planned spo_track_id,
+        interpret_id, interpret, cached spo_track_id, interpret name of
+        the last failed search).
+        """
+        return self.con.execute(
+            "SELECT p.cro_track_id, p.spo_track_id, interpret_id, "
+            "cro_interprets.interpret, m.spo_track_id, u.interpret "
+            "FROM playlist_plan_tracks AS p "
+            "LEFT JOIN cro_tracks ON p.cro_track_id = track_id "
+            "LEFT JOIN cro_interprets USING(interpret_id) "
+            "LEFT JOIN cro_spo_tracks AS m "
+            "ON p.cro_track_id = m.cro_track_id "
+            "LEFT JOIN cro_unmatched AS u "
+            "ON p.cro_track_id = u.cro_track_id "
+            "WHERE station = ? AND date = ? ORDER BY position",
+            (station, date.isoformat()),
+        ).fetchall()
+
+    def get_plans(self, station=None, since=None, until=None):
+        """Yield (station, date) tuples of all stored plans."""
+        r = self.con.execute(
+            "SELECT station, date FROM playlist_plans "
+            "WHERE (?1 IS NULL OR station = ?1) "
+            "AND (?2 IS NULL OR date >= ?2) "
+            "AND (?3 IS NULL OR date <= ?3) "
+            "ORDER BY date, station",
+            (
+                station,
+                since.isoformat() if since else None,
+                until.isoformat() if until else None,
+            ),
+        )
+        for st, d in r.fetchall():
+            yield st, _parse_date(d)
+
+    def get_pending_plans(self, account):
+        """
+        Yield (station, date) tuples of plans that have not been applied
+        to the account since their last change.
+        """
+        r = self.con.execute(
+            "SELECT station, date FROM playlist_plans AS p "
+            "WHERE NOT EXISTS (SELECT * FROM playlist_plan_applied AS a "
+            "WHERE a.station = p.station AND a.date = p.date "
+            "AND account = ? AND applied >= updated) "
+            "ORDER BY date, station",
+            (account,),
+        )
+        for st, d in r.fetchall():
+            yield st, _parse_date(d)
+
+    def get_plan_applied(self, station, date, account):
+        """
+        Return timestamp of the last time a plan was applied to the
+        account, or None if it never was.
+        """
+        r = self.con.execute(
+            "SELECT applied FROM playlist_plan_applied "
+            "WHERE station = ? AND date = ? AND account = ?",
+            (station, date.isoformat(), account),
+        ).fetchone()
+        if r:
+            return r[0]
+
+    def mark_plan_applied(self, station, date, account):
+        with self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO playlist_plan_applied "
+                "VALUES (?, ?, ?, ?)",
+                (station, date.isoformat(), account, time.time()),
+            )
+
+    def iter_table(self, table):
+        """Yield all rows of a snapshot table as tuples."""
+        columns = ", ".join(SNAPSHOT_TABLES[table])
+        for row in self.con.execute(f"SELECT {columns} FROM {table}"):
+            yield tuple(row)
+
+    def merge_rows(self, table, rows, keep_tracks=()):
+        """
+        Merge rows of a snapshot table into the cache. Existing rows are
+        kept, except for matches and track statuses, where the newer one
+        wins. Imported statuses affect matches as in store_track_status().
+        Matches of CRo tracks in `keep_tracks` (those with quirks) and
+        matches to tracks known to be unplayable are never imported,
+        matches to relinked tracks are imported with the new track id.
+        Return number of changed rows.
+        """
+        columns = SNAPSHOT_TABLES[table]
+        values = ", ".join("?" for _ in columns)
+        with self.con:
+            if table == "cro_spo_tracks":
+                return self._merge_matches(rows, keep_tracks)
+            if table == "spo_track_status":
+                return self._merge_status(rows)
+            before = self.con.total_changes
+            self.con.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({values})",
+                rows,
+            )
+            return self.con.total_changes - before
+
+    def _merge_status(self, rows):
+        self.con.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS snapshot_status "
+            "AS SELECT * FROM spo_track_status WHERE 0",
+        )
+        self.con.execute("DELETE FROM temp.snapshot_status")
+        self.con.executemany(
+            "INSERT INTO temp.snapshot_status VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self.con.execute(
+            "DELETE FROM temp.snapshot_status WHERE track_id IN "
+            "(SELECT s.track_id FROM temp.snapshot_status AS s "
+            "JOIN spo_track_status AS l USING(track_id) "
+            "WHERE s.checked <= l.checked)",
+        )
+        before = self.con.total_changes
+        self.con.execute(
+            "INSERT OR REPLACE INTO spo_track_status "
+            "SELECT * FROM temp.snapshot_status",
+        )
+        changed = self.con.total_changes - before
+        now = time.time()
+        dead = "(SELECT track_id FROM temp.snapshot_status WHERE NOT playable)"
+        self.con.execute(
+            "INSERT OR REPLACE INTO research_queue "
+            "SELECT cro_track_id, spo_track_id, ? "
+            f"FROM cro_spo_tracks WHERE spo_track_id IN {dead}",
+            (now,),
+        )
+        self.con.execute(
+            f"DELETE FROM cro_spo_tracks WHERE spo_track_id IN {dead}",
+        )
+        self.con.execute(
+            "UPDATE cro_spo_tracks SET matched = ?, spo_track_id = "
+            "(SELECT relinked_id FROM temp.snapshot_status AS s "
+            "WHERE s.track_id = spo_track_id) "
+            "WHERE spo_track_id IN (SELECT track_id "
+            "FROM temp.snapshot_status WHERE playable "
+            "AND relinked_id IS NOT NULL AND relinked_id != track_id)",
+            (now,),
+        )
+        return changed
+
+    def _merge_matches(self, rows, keep_tracks):
+        self.con.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS snapshot_matches "
+            "(cro_track_id INT PRIMARY KEY, spo_track_id TEXT, matched REAL)",
+        )
+        self.con.execute("DELETE FROM temp.snapshot_matches")
+        self.con.executemany(
+            "INSERT OR REPLACE INTO temp.snapshot_matches VALUES (?, ?, ?)",
+            rows,
+        )
+        self.con.executemany(
+            "DELETE FROM temp.snapshot_matches WHERE cro_track_id = ?",
+            ((t,) for t in keep_tracks),
+        )
+        self.con.execute(
+            "UPDATE temp.snapshot_matches SET spo_track_id = "
+            "(SELECT relinked_id FROM spo_track_status AS s "
+            "WHERE s.track_id = spo_track_id) "
+            "WHERE spo_track_id IN (SELECT track_id FROM spo_track_status "
+            "WHERE playable AND relinked_id IS NOT NULL "
+            "AND relinked_id != track_id)",
+        )
+        self.con.execute(
+            "DELETE FROM temp.snapshot_matches WHERE spo_track_id IN "
+            "(SELECT track_id FROM spo_track_status WHERE NOT playable)",
+        )
+        self.con.execute(
+            "DELETE FROM temp.snapshot_matches WHERE cro_track_id IN "
+            "(SELECT s.cro_track_id FROM temp.snapshot_matches AS s "
+            "JOIN cro_spo_tracks AS l USING(cro_track_id) "
+            "WHERE s.spo_track_id = l.spo_track_id "
+            "OR IFNULL(s.matched, 0) <= IFNULL(l.matched, 0))",
+        )
+        before = self.con.total_changes
+        self.con.execute(
+            "INSERT OR REPLACE INTO cro_spo_tracks "
+            "SELECT * FROM temp.snapshot_matches",
+        )
+        changed = self.con.total_changes - before
+        for t in ("cro_unmatched", "research_queue"):
+            self.con.execute(
+                f"DELETE FROM {t} WHERE cro_track_id IN "
+                "(SELECT cro_track_id FROM temp.snapshot_matches)",
+            )
+        return changed
+
+    def get_table_sizes(self):
+        """Return dictionary of row counts of all tables."""
+        tables = [
+            r[0] for r in self.con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "ORDER BY name",
+            )
+        ]
+        return {
+            t: self.con.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+            for t in tables
+        }
+
+    def get_pragmas(self):
+        """Return dictionary of storage related database settings."""
+        return {
+            p: self.con.execute(f"PRAGMA {p}").fetchone()[0]
+            for p in (
+                "page_size", "page_count", "freelist_count", "auto_vacuum",
+                "journal_mode",
+            )
+        }
+
+    def get_play_match_rate(self):
+        """Return tuple of numbers of matched plays and all plays."""
+        return tuple(self.con.execute(
+            "SELECT COUNT(spo_track_id), COUNT(*) FROM cro_plays "
+            "LEFT JOIN cro_spo_tracks ON track_id = cro_track_id",
+        ).fetchone())
+
+    def _delete_batches(self, table, where, args=(), batch=1000):
+        """
+        Delete rows in short transactions, so that other processes using
+        the cache are not blocked for long. Return number of deleted rows.
+        """
+        deleted = 0
+        while True:
+            with self.con:
+                n = self.con.execute(
+                    f"DELETE FROM {table} WHERE rowid IN "
+                    f"(SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                    (*args, batch),
+                ).rowcount
+            deleted += n
+            if n < batch:
+                return deleted
+
+    def prune_orphans(self, batch=1000):
+        """
+        Delete Spotify tracks and artists not referenced by any match,
+        cached playlist or track status, and queued searches of tracks
+        which have been matched since. Return dictionary of numbers of
+        deleted rows per table.
+        """
+        return {
+            "spo_tracks": self._delete_batches(
+                "spo_tracks",
+                "track_id NOT IN (SELECT spo_track_id FROM cro_spo_tracks "
+                "WHERE spo_track_id IS NOT NULL) "
+                "AND track_id NOT IN (SELECT track_id FROM "
+                "spo_playlist_tracks WHERE track_id IS NOT NULL) "
+                "AND track_id NOT IN (SELECT relinked_id FROM "
+                "spo_track_status WHERE relinked_id IS NOT NULL)",
+                batch=batch,
+            ),
+            "spo_tracks_artists": self._delete_batches(
+                "spo_tracks_artists",
+                "track_id NOT IN (SELECT track_id FROM spo_tracks "
+                "WHERE track_id IS NOT NULL)",
+                batch=batch,
+            ),
+            "spo_artists": self._delete_batches(
+                "spo_artists",
+                "artist_id NOT IN (SELECT artist_id FROM spo_tracks_artists "
+                "WHERE artist_id IS NOT NULL) "
+                "AND artist_id NOT IN (SELECT artist_id FROM cro_spo_artists "
+                "WHERE artist_id IS NOT NULL)",
+                batch=batch,
+            ),
+            "research_queue": self._delete_batches(
+                "research_queue",
+                "cro_track_id IN (SELECT cro_track_id FROM cro_spo_tracks)",
+                batch=batch,
+            ),
+        }
+
+    def prune_expired(self, before, batch=1000):
+        """
+        Delete cache entries older than timestamps given in the `before`
+        dictionary, keyed by `status`, `unmatched`, `playlists` and
+        `plans`. Return dictionary of numbers of deleted rows per table.
+        """
+        deleted = {}
+        if before.get("status"):
+            deleted["spo_track_status"] = self._delete_batches(
+                "spo_track_status", "checked < ?", (before["status"],), batch,
+            )
+        if before.get("unmatched"):
+            deleted["cro_unmatched"] = self._delete_batches(
+                "cro_unmatched", "searched < ?", (before["unmatched"],), batch,
+            )
+        if before.get("playlists"):
+            deleted["spo_playlists"] = self._delete_batches(
+                "spo_playlists", "updated < ?", (before["playlists"],), batch,
+            )
+            deleted["spo_playlist_tracks"] = self._delete_batches(
+                "spo_playlist_tracks",
+                "playlist_id NOT IN (SELECT playlist_id FROM spo_playlists "
+                "WHERE playlist_id IS NOT NULL)",
+                batch=batch,
+            )
+        if before.get("plans"):
+            d = datetime.date.fromtimestamp(before["plans"]).isoformat()
+            for t in (
+                "playlist_plans", "playlist_plan_tracks",
+                "playlist_plan_applied",
+            ):
+                deleted[t] = self._delete_batches(t, "date < ?", (d,), batch)
+        return deleted
+
+    def incremental_vacuum(self, pages=1000):
+        """
+        Return free pages to the file system, at most `pages` at once.
+        Return number of pages released.
+        """
+        before = self.get_pragmas()["freelist_count"]
+        # execute() would step the pragma once, releasing a single page
+        self.con.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return before - self.get_pragmas()["freelist_count"]
+
+    def enable_incremental_vacuum(self):
+        """
+        Switch an existing database to incremental vacuum. This rebuilds
+        the whole database and blocks other processes while running.
+        """
+        self.con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.con.execute("VACUUM")
+
+    def check(self, full=False):
+        """Return list of problems found by SQLite integrity check."""
+        pragma = "integrity_check" if full else "quick_check"
+        r = [row[0] for row in self.con.execute(f"PRAGMA {pragma}")]
+        return [] if r == ["ok"] else r
+
+
+def _parse_date(d):
+    return datetime.datetime.strptime(d, "%Y-%m-%d").date()
@@ -1,9 +1,10 @@
 import datetime
-from collections import namedtuple
 
 import requests
 import dateutil.parser
 
+from .records import make_playlist_item
+
 _stationnames = {
     "radiozurnal": "Radiožurnál",
     "dvojka": "Dvojka",
@@ -47,6 +48,13 @@ def get_cro_day_playlist(station="radiozurnal", date: datetime.date=None):
         url += f"{date:%Y/%m/%d/}"
     url += f"{station}.json"
     r = requests.get(url).json()
+    yield from parse_day_playlist(r)
+
+
+def parse_day_playlist(r):
+    """
+    Parse the playlist of a day as returned by CRo API.
+    """
     for i in r.get("data", []):
         i['since'] = dateutil.parser.parse(i['since'])
-        yield namedtuple("PlaylistItem", i.keys())(**i)
+        yield make_playlist_item(i)
@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from . import croapi
+from . import profiling
+from .cache import Cache
+
+
+def parse_dump(path):
+    """
+    Parse an archived `playlist/day` response of CRo API. The station is
+    taken from the file name, as in the API URL. Return (station, items)
+    tuple. Files that cannot be parsed are reported and yield no items.
+    """
+    station = Path(path).stem
+    try:
+        r = json.loads(Path(path).read_text(encoding="utf-8"))
+        return station, list(croapi.parse_day_playlist(r))
+    except (ValueError, KeyError, TypeError) as e:
+        click.secho(f"Skipping {path}: {e}", fg="yellow")
+        return station, []
+
+
+def find_dumps(directory):
+    """Yield archived playlists of known stations in a directory tree."""
+    stations = set(croapi.get_cro_stations())
+    for p in sorted(Path(directory).rglob("*.json")):
+        if p.stem in stations:
+            yield p
+        else:
+            click.secho(f"Skipping {p}: unknown station", fg="yellow")
+
+
+@click.command()
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache. (Created if necessary)",
+)
+@click.option(
+    "--jobs", "-j",
+    type=click.INT,
+    help="Number of parsing processes [default: number of CPUs]",
+)
+@click.option(
+    "--batch", "-b",
+    type=click.INT,
+    default=500,
+    show_default=True,
+    help="Number of files stored in one transaction",
+)
+@click.argument(
+    "directory",
+    metavar="<directory>",
+    type=click.Path(file_okay=False, exists=True),
+)
+@profiling.profile_options
+def ingest(cache, jobs, batch, directory):
+    """
+    Load archived daily playlists of CRo API from a directory tree into
+    the cache, including the play history. Files are expected to be named
+    after the station, like `2019/01/31/radiozurnal.json`. Files can be
+    loaded repeatedly, already known plays are skipped.
+    """
+    c = Cache(cache)
+    dumps = list(find_dumps(directory))
+    plays = 0
+    with ProcessPoolExecutor(jobs) as ex, \
+            profiling.section("ingest"), \
+            click.progressbar(length=len(dumps), label="Loading") as bar:
+        parsed = ex.map(parse_dump, dumps, chunksize=16)
+        while True:
+            playlists = list(islice(parsed, batch))
+            if not playlists:
+                break
+            plays += c.store_cro_playlists(playlists)
+            bar.update(len(playlists))
+    click.secho(
+        f"Processed {plays} plays from {len(dumps)} files.",
+        bold=True,
+    )
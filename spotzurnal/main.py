@@ -6,7 +6,8 @@ from yaml import safe_load
 
 from . import croapi
 from . import matcher
-from .spotify import Spotify
+from . import profiling
+from .spotify import Spotify, get_accounts
 from .cache import Cache
 from .clickdate import ClickDate
 from .aggregator import parse_plname
@@ -18,13 +19,19 @@ from .aggregator import parse_plname
     metavar="<credentials_json_file>",
     show_default=True,
     type=click.Path(dir_okay=False),
-    default=str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
-    help="Path where to store credentials.",
+    default=[
+        str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
+    ],
+    help="Path where to store credentials. "
+    "(can be used multiple times to write playlists to more accounts)",
+    multiple=True,
 )
 @click.option(
     "--username", "-u",
     metavar="USER",
-    help="Spotify user name",
+    help="Spotify user name (can be used multiple times, "
+    "in the order of credentials)",
+    multiple=True,
 )
 @click.option(
     "--date", "-d",
@@ -61,19 +68,27 @@ from .aggregator import parse_plname
     type=click.File(),
     help="Path to hand-kept quirks file",
 )
+@profiling.profile_options
 def main(credentials, username, date, station, replace, cache, quirks):
     """
     Generate a Spotify playlist from a playlist published
     by the Czech Radio.
+
+    With more credentials, every playlist is matched only once and written
+    to all the accounts.
     """
-    sp = Spotify(username=username, credfile=credentials)
+    accounts = get_accounts(credentials, username)
     c = Cache(cache)
     if quirks:
         q = safe_load(quirks)
     else:
         q = None
+    indexes = {}
     for st, d in ((st, d) for d in date for st in station):
-        matcher.match_cro_playlist(sp, d, st, replace, c, q)
+        with profiling.section(f"{st}-{d:%Y-%m-%d}"):
+            matcher.match_cro_playlist(
+                accounts, d, st, replace, c, q, indexes,
+            )
         print()
 
 
@@ -117,10 +132,21 @@ def main(credentials, username, date, station, replace, cache, quirks):
     type=click.File(),
     help="Path to hand-kept quirks file",
 )
-def rematch(credentials, username, month, station, cache, quirks):
+@click.option(
+    "--all", "-a", "rematch_all",
+    is_flag=True,
+    help="Rematch all playlists, not only the affected ones",
+)
+@profiling.profile_options
+def rematch(
+        credentials, username, month, station, cache, quirks, rematch_all,
+):
     """
     Regenerate Spotify playlists from a playlist published
     by the Czech Radio -- possibly using new quirks and cache contents.
+
+    Only playlists whose content would change, or which were modified
+    since they were last written, are regenerated, unless --all is given.
     """
     sp = Spotify(username=username, credfile=credentials)
     c = Cache(cache)
@@ -139,5 +165,14 @@ def rematch(credentials, username, month, station, cache, quirks):
         and p.date.year == month.year
         and p.date.month == month.month
     ]
+    if not rematch_all:
+        with profiling.section("rematch-dirty"):
+            playlists = [
+                p for p in playlists
+                if matcher.is_plan_dirty(c, q, p.station, p.date)
+                or c.get_playlist_snapshot(p.id) not in (None, p.snapshot_id)
+            ]
+    click.secho(f"Rematching {len(playlists)} playlists", bold=True)
     for p in playlists:
-        matcher.match_cro_playlist(sp, p.date, p.station, True, c, q)
+        with profiling.section(f"{p.station}-{p.date:%Y-%m-%d}"):
+            matcher.match_cro_playlist(sp, p.date, p.station, True, c, q)
@@ -0,0 +1,177 @@
+import sys
+import time
+from pathlib import Path
+
+import click
+
+from . import profiling
+from .cache import Cache
+
+
+def rate(hits, misses):
+    total = hits + misses
+    if total:
+        return f"{hits}/{total} – {100*hits/total:.0f}%"
+    return "n/a"
+
+
+@click.group()
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.pass_context
+def cache(ctx, cache):
+    """
+    Inspect and maintain the cache database. All the commands can run
+    alongside other spotzurnal processes using the same cache.
+    """
+    ctx.obj = Cache(cache)
+
+
+@cache.command()
+@click.pass_obj
+@profiling.profile_options
+def stats(c):
+    """Show sizes of tables, hit rates and storage usage."""
+    with profiling.section("cache-stats"):
+        sizes = c.get_table_sizes()
+        counters = c.get_counters()
+        pragmas = c.get_pragmas()
+        matched, plays = c.get_play_match_rate()
+    click.secho("Tables:", bold=True)
+    for table, n in sizes.items():
+        print(f"  {table:24} {n:10}")
+    click.secho("Hit rates:", bold=True)
+    print("  Match lookups:      " + rate(
+        counters.get("match_hit", 0), counters.get("match_miss", 0),
+    ))
+    print("  Playlist snapshots: " + rate(
+        counters.get("playlist_hit", 0), counters.get("playlist_miss", 0),
+    ))
+    print("  Matched plays:      " + rate(matched, plays - matched))
+    click.secho("Storage:", bold=True)
+    size = Path(c.dbfile).stat().st_size
+    page = pragmas["page_size"]
+    print(f"  File size:  {size / 2**20:10.1f} MiB")
+    print(f"  Pages:      {pragmas['page_count']:10} × {page} B")
+    print(f"  Free pages: {pragmas['freelist_count']:10}")
+    print("  Auto vacuum: " + {0: "none", 1: "full", 2: "incremental"}.get(
+        pragmas["auto_vacuum"], str(pragmas["auto_vacuum"]),
+    ))
+    print(f"  Journal:     {pragmas['journal_mode']}")
+
+
+@cache.command()
+@click.option(
+    "--status-days",
+    type=click.FLOAT,
+    default=180,
+    show_default=True,
+    help="Forget track availability checked more days ago (0 to keep)",
+)
+@click.option(
+    "--unmatched-days",
+    type=click.FLOAT,
+    default=0,
+    show_default=True,
+    help="Forget failed searches done more days ago, so that they are "
+    "retried by the next rematch (0 to keep)",
+)
+@click.option(
+    "--playlist-days",
+    type=click.FLOAT,
+    default=90,
+    show_default=True,
+    help="Forget cached playlist contents stored more days ago (0 to keep)",
+)
+@click.option(
+    "--plan-days",
+    type=click.FLOAT,
+    default=0,
+    show_default=True,
+    help="Forget plans of playlists older than this many days, they are "
+    "needed by rematch (0 to keep)",
+)
+@click.option(
+    "--batch",
+    type=click.INT,
+    default=1000,
+    show_default=True,
+    help="Number of rows deleted in one transaction",
+)
+@click.pass_obj
+@profiling.profile_options
+def prune(c, status_days, unmatched_days, playlist_days, plan_days, batch):
+    """Delete orphaned and expired cache entries."""
+    now = time.time()
+    days = {
+        "status": status_days,
+        "unmatched": unmatched_days,
+        "playlists": playlist_days,
+        "plans": plan_days,
+    }
+    before = {k: now - v * 86400 for k, v in days.items() if v}
+    with profiling.section("cache-prune"):
+        deleted = c.prune_expired(before, batch)
+        deleted.update(c.prune_orphans(batch))
+    for table, n in deleted.items():
+        print(f"{table}: {n} rows deleted")
+
+
+@cache.command()
+@click.option(
+    "--pages",
+    type=click.INT,
+    default=1000,
+    show_default=True,
+    help="Number of pages released in one step",
+)
+@click.option(
+    "--enable",
+    is_flag=True,
+    help="Switch an older cache to incremental vacuum first. This rebuilds "
+    "the whole file and blocks other processes while running.",
+)
+@click.pass_obj
+@profiling.profile_options
+def compact(c, pages, enable):
+    """Return free space of the cache file to the file system."""
+    if c.get_pragmas()["auto_vacuum"] != 2:
+        if not enable:
+            sys.exit(click.style(
+                "Error: Incremental vacuum is not enabled for this cache, "
+                "use --enable",
+                fg="red",
+            ))
+        with profiling.section("cache-enable-vacuum"):
+            c.enable_incremental_vacuum()
+    released = 0
+    with profiling.section("cache-compact"):
+        while True:
+            n = c.incremental_vacuum(pages)
+            released += n
+            if n < pages:
+                break
+    print(f"Released {released} pages.")
+
+
+@cache.command()
+@click.option(
+    "--full",
+    is_flag=True,
+    help="Run the full integrity check, which is slower",
+)
+@click.pass_obj
+@profiling.profile_options
+def check(c, full):
+    """Check integrity of the cache database."""
+    with profiling.section("cache-check"):
+        problems = c.check(full)
+    if problems:
+        sys.exit(click.style("\n".join(problems), fg="red"))
+    print("ok")
@@ -1,11 +1,11 @@
 import re
-import locale
 from difflib import SequenceMatcher
 
 import click
 
 from . import croapi
 from .cache import Cache
+from .records import MatchResult
 
 
 def get_spotify_artist_title(spotrack):
@@ -14,8 +14,8 @@ def get_spotify_artist_title(spotrack):
     return spoartist, spotitle
 
 
-def print_spotify_track(spotrack, **kwargs):
-    click.secho(
+def print_spotify_track(spotrack, log=click.secho, **kwargs):
+    log(
         "^ Sp.: {} - {}".format(
             *get_spotify_artist_title(spotrack)
         ),
@@ -36,8 +36,26 @@ def get_ratios(spotrack, croartist, crotitle):
     return aratio, tratio
 
 
-def search_spotify_track(sp, croartist, crotitle):
-    """Do a Spotify search for a track of an artist."""
+def get_playable_items(r, cache=None):
+    """
+    Return tracks of a search response, without those known to be
+    unplayable by the cache.
+    """
+    items = r["tracks"]["items"]
+    if cache and items:
+        dead = cache.get_unplayable(i["id"] for i in items)
+        items = [i for i in items if i["id"] not in dead]
+    return items
+
+
+def search_spotify_track(
+        sp, croartist, crotitle, log=click.secho, cache=None,
+):
+    """
+    Do a Spotify search for a track of an artist. Progress is reported by
+    calling `log` with the same arguments as click.secho(). With `cache`,
+    tracks found unplayable by revalidation are never matched again.
+    """
 
     artist = croartist.lower().replace("´", "'").replace("+", " ")
     title = crotitle.lower().replace("´", "'").replace("+", " ")
@@ -48,32 +66,32 @@ def search_spotify_track(sp, croartist, crotitle):
         limit=10,
         market="CZ",
     )
-    items = r["tracks"]["items"]
+    items = get_playable_items(r, cache)
     if not items:
         # Retry with only first artist and without parentheses in title
         artist2 = artist.split(",")[0].split("/")[0].split("&")[0]
         artist2 = artist2.split("feat")[0].split("ft.")[0]
         title2 = title.split("(")[0].split("feat")[0].split("ft. ")[0]
         if artist2 != artist or title2 != title:
-            click.secho(f"^ Retrying as {artist2} - {title2}", fg="yellow")
+            log(f"^ Retrying as {artist2} - {title2}", fg="yellow")
             r = sp.search(
                 f"artist:{artist2} track:{title2}",
                 type="track",
                 limit=10,
                 market="CZ",
             )
-            items = r["tracks"]["items"]
+            items = get_playable_items(r, cache)
     if not items:
         # Retry with just title
         title = title.translate(str.maketrans(",;&()", "     ", ".''`"))
-        click.secho(f"^ Retrying as track:{title}", fg="yellow")
+        log(f"^ Retrying as track:{title}", fg="yellow")
         r = sp.search(
             f"track:{title}",
             type="track",
             limit=10,
             market="CZ",
         )
-        items = r["tracks"]["items"]
+        items = get_playable_items(r, cache)
         if items:
             ara = []
             for i in items:
@@ -81,14 +99,14 @@ def search_spotify_track(sp, croartist, crotitle):
                 ara.append(ar)
             n, ar = max(enumerate(ara), key=lambda x: x[1])
             if ar < 0.5:
-                print_spotify_track(items[n], fg="red")
-                click.secho(
+                print_spotify_track(items[n], log, fg="red")
+                log(
                     f"^ Unmatched with {ar:.2f}, {tr:.2f}",
                     fg="red",
                 )
                 return
     if not items:
-        click.secho("^ Not found", fg="red")
+        log("^ Not found", fg="red")
         return
     ara, tra, ra = [], [], []
     for i in items:
@@ -98,24 +116,26 @@ def search_spotify_track(sp, croartist, crotitle):
         ra.append(ar+tr)
     n, r = max(enumerate(ra), key=lambda x: x[1])
     if r > 0.5:
-        print_spotify_track(items[n], fg="green")
-        click.secho(f"^ Matched with {ara[n]:.2f}, {tra[n]:.2f}", fg="cyan")
+        print_spotify_track(items[n], log, fg="green")
+        log(f"^ Matched with {ara[n]:.2f}, {tra[n]:.2f}", fg="cyan")
         return items[n]
     else:
-        print_spotify_track(items[n], fg="red")
-        click.secho(f"^ Unmatched with {ar:.2f}, {tr:.2f}", fg="red")
+        print_spotify_track(items[n], log, fg="red")
+        log(f"^ Unmatched with {ar:.2f}, {tr:.2f}", fg="red")
 
 
 def get_plname(station, date):
     """Return name of playlist for certain station and date."""
-    locale.setlocale(locale.LC_TIME, "cs_CZ")
+    dname = (
+        "pondělí", "úterý", "středa", "čtvrtek", "pátek", "sobota", "neděle",
+    )
     mname = (
         None, "ledna", "února", "března", "dubna", "května", "června",
         "července", "srpna", "září", "října", "listopadu", "prosince",
     )
     return "{} {} {}. {} {}".format(
         croapi.get_cro_station_name(station),
-        date.strftime("%A").lower(),
+        dname[date.weekday()],
         date.day,
         mname[date.month],
         date.year,
@@ -131,88 +151,205 @@ def get_track_quirk(quirks, cro_track_id):
             return m.group(1)
 
 
-def get_artist_quirk(quirks, interpret_id):
+def get_artist_quirk(quirks, interpret_id, log=click.secho):
     i = quirks["artists"].get(interpret_id)
     if i:
-        click.secho(f"Corrected artist to {i}.", fg="yellow")
+        log(f"Corrected artist to {i}.", fg="yellow")
         return i
 
 
-def match_cro_playlist(
-        sp, date, station, replace=False, cache=None, quirks=None,
-):
+def lookup_track(track, cache, quirks, log=click.secho):
     """
-    Generate a Spotify playlist from a playlist published
-    by the Czech Radio.
+    Store a CRo playlist item in the cache and return its Spotify track id
+    from quirks or the cache, or None if it has to be searched for.
     """
-    c = cache or Cache()
-    q = quirks or {"artists": {}, "tracks": {}}
-    trackids = []
-    unmatched = []
-    fromcache = 0
-    pl = croapi.get_cro_day_playlist(station, date)
-    for n, track in enumerate(pl, start=1):
-        c.store_cro_track(track)
-        m = get_track_quirk(q, track.track_id) or c.lookup_match(track)
-        if m:
-            fromcache += 1
-        else:
-            print(f"{track.since:%H:%M}: {track.interpret} - {track.track}")
-            interpret = (
-                get_artist_quirk(q, track.interpret_id) or track.interpret
-            )
-            t = search_spotify_track(sp, interpret, track.track)
-            if t:
-                c.store_spotify_track(t, track)
-                m = t.get("id")
-        if m:
-            trackids.append(m)
-        else:
-            unmatched.append(track)
-    matched = len(trackids)
+    cache.store_cro_track(track, log)
+    return get_track_quirk(quirks, track.track_id) or cache.lookup_match(track)
+
+
+def store_search_result(track, interpret, spotrack, cache):
+    """
+    Store the result of searching for a CRo playlist item under an
+    interpret name. Return the Spotify track id, or None if not found.
+    """
+    if spotrack:
+        cache.store_spotify_track(spotrack, track)
+        return spotrack.get("id")
+    cache.store_unmatched(track, interpret)
+
+
+def match_track(sp, track, cache, quirks, log=click.secho):
+    """
+    Match a CRo playlist item to a Spotify track, using quirks, the cache
+    or a Spotify search. Return tuple of Spotify track id (None if not
+    found) and a flag whether no search was needed.
+    """
+    m = lookup_track(track, cache, quirks, log)
+    if m:
+        return m, True
+    log(f"{track.since:%H:%M}: {track.interpret} - {track.track}")
+    interpret = (
+        get_artist_quirk(quirks, track.interpret_id, log) or track.interpret
+    )
+    t = search_spotify_track(sp, interpret, track.track, log, cache)
+    return store_search_result(track, interpret, t, cache), False
+
+
+def store_match_result(cache, station, date, items, matches, messages=()):
+    """
+    Store matched playlist items as a plan in the cache. `matches` are
+    the results of match_track() for each item. Return MatchResult.
+    """
+    cache.store_plan(
+        station, date,
+        [(i.track_id, m) for i, (m, _) in zip(items, matches)],
+    )
+    cache.flush_counters()
+    return MatchResult(
+        station, date, items,
+        [m for m, _ in matches],
+        sum(1 for _, cached in matches if cached),
+        list(messages),
+    )
+
+
+def report_match_result(result, log=click.secho):
+    """Report statistics and unmatched tracks of a MatchResult."""
+    matched, n = len(result.trackids), len(result.items)
     if matched < 1:
-        click.secho("No tracks found!", fg="red")
+        log("No tracks found!", fg="red")
         return
+    fromcache = result.fromcache
     pct, cachepct = 100*matched/n, 100*fromcache/matched
-    click.secho(f"Matched {matched}/{n} – {pct:.0f}%", bold=True)
-    click.secho(
+    log(f"Matched {matched}/{n} – {pct:.0f}%", bold=True)
+    log(
         f"Already cached {fromcache}/{matched} – {cachepct:.0f}%",
         bold=True,
     )
-    if unmatched:
-        click.secho("Unmatched tracks:", bold=True)
-        print("\n".join(
+    if result.unmatched:
+        log("Unmatched tracks:", bold=True)
+        log("\n".join(
             f"{t.since:%H:%M}: {t.interpret} ({t.interpret_id}) - "
             f"{t.track} ({t.track_id})"
-            for t in unmatched
+            for t in result.unmatched
         ))
+
+
+def plan_cro_playlist(sp, date, station, cache=None, quirks=None):
+    """
+    Match a playlist published by the Czech Radio to Spotify tracks and
+    store the result as a plan in the cache. Return list of matched Spotify
+    track ids.
+    """
+    c = cache or Cache()
+    q = quirks or {"artists": {}, "tracks": {}}
+    pl = list(croapi.get_cro_day_playlist(station, date))
+    c.store_plays(station, pl)
+    matches = [match_track(sp, track, c, q) for track in pl]
+    result = store_match_result(c, station, date, pl, matches)
+    report_match_result(result)
+    return result.trackids
+
+
+def is_plan_dirty(cache, quirks, station, date):
+    """
+    Return True if the stored plan for a station-day would change with
+    current quirks and cache contents, or if there is no plan stored.
+    """
+    q = quirks or {"artists": {}, "tracks": {}}
+    state = cache.get_plan_state(station, date)
+    if not state:
+        return True
+    for cro, planned, iid, interpret, cached, searched in state:
+        m = get_track_quirk(q, cro) or cached
+        if m != planned:
+            return True
+        if not m and searched != (q["artists"].get(iid) or interpret):
+            # Never searched under the current interpret name
+            return True
+    return False
+
+
+def apply_playlist(
+        sp, date, station, trackids, replace=False, index=None,
+        log=click.secho, cache=None,
+):
+    """
+    Write matched Spotify track ids to the playlist of a station-day.
+    Return the playlist id.
+
+    `index` is an optional dictionary mapping playlist names to ids, as
+    returned by Spotify.get_playlist_index(). It saves listing all user
+    playlists when applying many playlists at once.
+
+    With `cache`, the snapshot id and content of a replaced playlist are
+    stored, so that they need not be downloaded again.
+    """
+    matched = len(trackids)
     plname = get_plname(station, date)
-    click.secho(
+    log(
         f"Playlist name: {plname}",
         bold=True,
     )
-    playlist = sp.get_or_create_playlist(plname)
-    click.secho(
+    playlist = sp.get_or_create_playlist(plname, index=index)
+    log(
         "Playlist URL: https://open.spotify.com/user/"
         f"{sp.user}/playlist/{playlist}",
         bold=True,
     )
+    r = None
     if replace:
-        sp.user_playlist_replace_tracks(sp.user, playlist, trackids[:100])
+        r = sp.user_playlist_replace_tracks(sp.user, playlist, trackids[:100])
     total = sp.user_playlist_tracks(sp.user, playlist, fields="total")["total"]
     if 0 < total < matched and not replace:
-        print(
+        log(
             "Keeping {} tracks already in playlist, adding {} more.".format(
                 total, matched - total,
             ),
         )
     if total >= matched and not replace:
-        print("No new tracks found.")
+        log("No new tracks found.")
     else:
-        sp.put_all_data(
+        r = sp.put_all_data(
             sp.user_playlist_add_tracks,
             trackids,
             sp.user,
             playlist,
             offset=total,
-        )
+        ) or r
+    if cache:
+        snapshot = r.get("snapshot_id") if isinstance(r, dict) else None
+        if replace and snapshot:
+            cache.store_playlist_tracks(playlist, snapshot, trackids)
+        else:
+            cache.forget_playlist_tracks(playlist)
+    return playlist
+
+
+def match_cro_playlist(
+        sp, date, station, replace=False, cache=None, quirks=None,
+        indexes=None,
+):
+    """
+    Generate a Spotify playlist from a playlist published
+    by the Czech Radio.
+
+    `sp` can also be a list of Spotify clients. The playlist is then
+    matched using the first one and written to all of them. `indexes` is
+    an optional dictionary of playlist name indexes per user, filled in
+    on first use.
+    """
+    c = cache or Cache()
+    accounts = sp if isinstance(sp, list) else [sp]
+    trackids = plan_cro_playlist(accounts[0], date, station, c, quirks)
+    for a in accounts:
+        if trackids:
+            index = None
+            if indexes is not None:
+                if a.user not in indexes:
+                    indexes[a.user] = a.get_playlist_index()
+                index = indexes[a.user]
+            apply_playlist(
+                a, date, station, trackids, replace, index, cache=c,
+            )
+        c.mark_plan_applied(station, date, a.user)
@@ -0,0 +1,231 @@
+import sys
+import json
+import time
+from pathlib import Path
+
+import click
+from yaml import safe_load
+
+from . import croapi
+from . import matcher
+from . import profiling
+from .spotify import Spotify, get_accounts
+from .cache import Cache
+from .clickdate import ClickDate
+
+
+@click.command()
+@click.option(
+    "--credentials", "-c",
+    metavar="<credentials_json_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
+    help="Path where to store credentials.",
+)
+@click.option(
+    "--date", "-d",
+    type=ClickDate(),
+    default=["today", ],
+    show_default=True,
+    help="Date of the playlist (can be used multiple times)",
+    multiple=True,
+)
+@click.option(
+    "--station", "-s",
+    type=click.Choice(croapi.get_cro_stations()),
+    default=["radiozurnal", ],
+    show_default=True,
+    help="The station to grab (can be used multiple times)",
+    multiple=True,
+)
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache. (Created if necessary)",
+)
+@click.option(
+    "--quirks", "-q",
+    metavar="<quirks_yaml_file>",
+    show_default=True,
+    type=click.File(),
+    help="Path to hand-kept quirks file",
+)
+@profiling.profile_options
+def plan(credentials, date, station, cache, quirks):
+    """
+    Match playlists published by the Czech Radio and store them as plans
+    in the cache. No Spotify playlist is modified, so only the App client
+    credentials are needed.
+    """
+    sp = Spotify(credfile=credentials, anonymous=True)
+    c = Cache(cache)
+    if quirks:
+        q = safe_load(quirks)
+    else:
+        q = None
+    for st, d in ((st, d) for d in date for st in station):
+        click.secho(f"Planning {st} {d:%Y-%m-%d}", bold=True)
+        with profiling.section(f"{st}-{d:%Y-%m-%d}"):
+            matcher.plan_cro_playlist(sp, d, st, c, q)
+        print()
+
+
+@click.command()
+@click.option(
+    "--credentials", "-c",
+    metavar="<credentials_json_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=[
+        str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
+    ],
+    help="Path where to store credentials. "
+    "(can be used multiple times to write playlists to more accounts)",
+    multiple=True,
+)
+@click.option(
+    "--username", "-u",
+    metavar="USER",
+    help="Spotify user name (can be used multiple times, "
+    "in the order of credentials)",
+    multiple=True,
+)
+@click.option(
+    "--replace/--no-replace", "-r",
+    help="Replace existing playlist instead of appending "
+    "(always done for plans changed since they were applied)",
+)
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.option(
+    "--delay",
+    type=click.FLOAT,
+    default=0.0,
+    show_default=True,
+    help="Seconds to wait between writing two playlists",
+)
+@profiling.profile_options
+def apply(credentials, username, replace, cache, delay):
+    """
+    Write all pending plans from the cache to Spotify playlists of all
+    the accounts.
+    """
+    c = Cache(cache)
+    for sp in get_accounts(credentials, username):
+        apply_pending(sp, c, replace, delay)
+
+
+def apply_pending(sp, c, replace=False, delay=0.0):
+    """
+    Write plans pending for the user of a Spotify client. Playlists of
+    plans that were applied before are always replaced, as appending
+    would not reflect changes in the middle of the plan.
+    """
+    pending = list(c.get_pending_plans(sp.user))
+    if not pending:
+        print(f"No pending plans for {sp.user}.")
+        return
+    index = sp.get_playlist_index()
+    for n, (st, d) in enumerate(pending):
+        if n and delay:
+            time.sleep(delay)
+        trackids = [s for _, s in c.get_plan(st, d) if s]
+        rewrite = replace or c.get_plan_applied(st, d, sp.user) is not None
+        if trackids:
+            with profiling.section(f"{sp.user}-{st}-{d:%Y-%m-%d}"):
+                matcher.apply_playlist(
+                    sp, d, st, trackids, rewrite, index, cache=c,
+                )
+            print()
+        c.mark_plan_applied(st, d, sp.user)
+
+
+@click.command()
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.option(
+    "--station", "-s",
+    type=click.Choice(croapi.get_cro_stations()),
+    help="Export only plans of this station",
+)
+@click.option(
+    "--since",
+    type=ClickDate(),
+    help="Export only plans since this date",
+)
+@click.option(
+    "--until",
+    type=ClickDate(),
+    help="Export only plans until this date",
+)
+@click.option(
+    "--format", "-f", "fmt",
+    type=click.Choice(["json", "m3u"]),
+    default="json",
+    show_default=True,
+    help="Output format",
+)
+@click.option(
+    "--output", "-o",
+    metavar="<output_file>",
+    type=click.File("w"),
+    default=sys.stdout,
+    help="Output file.",
+)
+@profiling.profile_options
+def export(cache, station, since, until, fmt, output):
+    """
+    Export stored plans without touching Spotify.
+    """
+    c = Cache(cache)
+    plans = c.get_plans(station, since, until)
+    with output, profiling.section("export"):
+        if fmt == "m3u":
+            output.write("#EXTM3U\n")
+            for st, d in plans:
+                output.write(f"#PLAYLIST:{matcher.get_plname(st, d)}\n")
+                for _, interpret, track, spo in c.get_plan_tracks(st, d):
+                    if spo:
+                        output.write(f"#EXTINF:-1,{interpret} - {track}\n")
+                        output.write(f"spotify:track:{spo}\n")
+        else:
+            json.dump(
+                [
+                    {
+                        "station": st,
+                        "date": d.isoformat(),
+                        "name": matcher.get_plname(st, d),
+                        "tracks": [
+                            {
+                                "cro_track_id": cro,
+                                "interpret": interpret,
+                                "track": track,
+                                "spotify_track_id": spo,
+                            }
+                            for cro, interpret, track, spo
+                            in c.get_plan_tracks(st, d)
+                        ],
+                    }
+                    for st, d in plans
+                ],
+                output,
+                ensure_ascii=False,
+                indent=2,
+            )
+            output.write("\n")
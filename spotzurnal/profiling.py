@@ -0,0 +1,170 @@
+import sys
+import cProfile
+import threading
+import functools
+import contextlib
+from pathlib import Path
+from collections import Counter
+
+import click
+
+_profiler = None
+
+
+class Profiler:
+    """
+    Write profiles of named sections of the program into a directory.
+
+    In `cprofile` mode, every section is profiled by cProfile and dumped
+    as `<name>.prof`, suitable for pstats or snakeviz. In `sample` mode,
+    a background thread samples stacks of all threads every `interval`
+    seconds and every section is written as `<name>.collapsed` in the
+    collapsed-stack format of flamegraph.pl. Sampling has a low overhead,
+    so it can be left enabled in production.
+    """
+
+    def __init__(self, directory, mode="cprofile", interval=0.01):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.interval = interval
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.mode == "sample":
+            self._sampler = threading.Thread(
+                target=self._sample,
+                name="spotzurnal-sampler",
+                daemon=True,
+            )
+            self._sampler.start()
+
+    def stop(self):
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = [
+                collapse_stack(frame)
+                for tid, frame in sys._current_frames().items()
+                if tid != me
+            ]
+            with self._lock:
+                self.counts.update(stacks)
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if getattr(self._local, "active", False):
+            # Nested sections are part of the outer one
+            yield
+            return
+        self._local.active = True
+        try:
+            if self.mode == "sample":
+                with self._lock:
+                    before = self.counts.copy()
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        counts = self.counts - before
+                    self.write_collapsed(name, counts)
+            else:
+                p = cProfile.Profile()
+                p.enable()
+                try:
+                    yield
+                finally:
+                    p.disable()
+                    p.dump_stats(str(self.directory / f"{name}.prof"))
+        finally:
+            self._local.active = False
+
+    def write_collapsed(self, name, counts):
+        with open(self.directory / f"{name}.collapsed", "w") as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def collapse_stack(frame):
+    """Return stack of a frame as semicolon separated list of functions."""
+    stack = []
+    while frame:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        stack.append(f"{module}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+@contextlib.contextmanager
+def section(name):
+    """
+    Profile a named section of the program if profiling is enabled.
+    """
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.section(name):
+            yield
+
+
+@contextlib.contextmanager
+def profiling(directory, mode="cprofile", interval=0.01):
+    """Enable profiling into a directory for the duration of the context."""
+    global _profiler
+    if not directory:
+        yield
+        return
+    _profiler = Profiler(directory, mode, interval)
+    _profiler.start()
+    try:
+        yield _profiler
+    finally:
+        _profiler.stop()
+        _profiler = None
+
+
+def profile_options(f):
+    """
+    Add profiling options to a click command. Must be used as the
+    innermost decorator.
+    """
+    @functools.wraps(f)
+    def wrapper(*args, profile, profile_mode, profile_interval, **kwargs):
+        with profiling(profile, profile_mode, profile_interval):
+            return f(*args, **kwargs)
+
+    options = [
+        click.option(
+            "--profile",
+            metavar="<profile_directory>",
+            type=click.Path(file_okay=False),
+            help="Write profiles of the run into this directory.",
+        ),
+        click.option(
+            "--profile-mode",
+            type=click.Choice(["cprofile", "sample"]),
+            default="cprofile",
+            show_default=True,
+            help="Deterministic cProfile dumps or sampled collapsed stacks "
+            "for flame graphs.",
+        ),
+        click.option(
+            "--profile-interval",
+            type=click.FLOAT,
+            default=0.01,
+            show_default=True,
+            help="Sampling interval in seconds.",
+        ),
+    ]
+    for option in reversed(options):
+        wrapper = option(wrapper)
+    return wrapper
@@ -4,6 +4,7 @@ from pathlib import Path
 import click
 from yaml import safe_load
 
+from . import profiling
 from .cache import Cache
 
 
@@ -36,6 +37,7 @@ from .cache import Cache
     is_flag=True,
     help="Edit quirks file in place.",
 )
+@profiling.profile_options
 def quirkgen(cache, quirks, output, in_place):
     """
     Get all unmatched songs from cache. Add them to quirks file for manual
@@ -51,6 +53,16 @@ def quirkgen(cache, quirks, output, in_place):
     else:
         q = {"artists": {}, "tracks": {}}
     c = Cache(cache)
+    with profiling.section("quirkgen"):
+        out = generate_quirks(c, q)
+    if in_place:
+        output = open(quirks, "w")
+    with output:
+        output.write("\n".join(out))
+
+
+def generate_quirks(c, q):
+    """Return lines of YAML quirks file."""
     tracks = c.get_unmatched_tracks()
     # We generate our custom YAML with coments
     out = []
@@ -71,7 +83,4 @@ def quirkgen(cache, quirks, output, in_place):
             out.append(f"# {a.interpret}")
         out.append(f"  {k}: \"{v}\"")
     out.append("\n...\n")
-    if in_place:
-        output = open(quirks, "w")
-    with output:
-        output.write("\n".join(out))
+    return out
@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+# Record types are built once at import time. Creating a namedtuple class
+# is orders of magnitude more expensive than creating an instance of it.
+
+PlaylistItem = namedtuple(
+    "PlaylistItem",
+    "since, interpret, interpret_id, track, track_id, extra",
+)
+
+Track = namedtuple("Track", "track_id, track, interpret_id, interpret")
+
+Interpret = namedtuple("Interpret", "interpret_id, interpret")
+
+
+class MatchResult(namedtuple(
+    "MatchResult",
+    "station, date, items, matches, fromcache, messages",
+)):
+    """
+    Result of matching a CRo playlist of a station-day. `matches` are
+    Spotify track ids (or None) for each of the playlist `items`,
+    `messages` are (text, style) tuples of the matching progress.
+    """
+    __slots__ = ()
+
+    @property
+    def trackids(self):
+        return [m for m in self.matches if m]
+
+    @property
+    def unmatched(self):
+        return [i for i, m in zip(self.items, self.matches) if not m]
+
+
+_playlistitem_fields = frozenset(PlaylistItem._fields) - {"extra"}
+
+
+def make_playlist_item(item):
+    """
+    Make a PlaylistItem out of a dictionary returned by CRo API.
+
+    Missing fields default to None, unknown fields are kept in the `extra`
+    dictionary.
+    """
+    extra = {k: v for k, v in item.items() if k not in _playlistitem_fields}
+    return PlaylistItem(
+        item.get("since"),
+        item.get("interpret"),
+        item.get("interpret_id"),
+        item.get("track"),
+        item.get("track_id"),
+        extra,
+    )
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import click
+
+from . import profiling
+from .spotify import Spotify
+from .cache import Cache
+
+
+def revalidate_chunk(sp, c, trackids):
+    """
+    Check availability of Spotify tracks in the CZ market by a single API
+    call and record the results in the cache. Return numbers of dead and
+    relinked tracks.
+    """
+    dead, relinked = 0, 0
+    r = sp.tracks(trackids, market="CZ")
+    for trackid, t in zip(trackids, r["tracks"]):
+        if not t or not t.get("is_playable", True):
+            c.store_track_status(trackid, False)
+            dead += 1
+        elif t["id"] != trackid:
+            c.store_track_status(trackid, True, t["id"], t)
+            relinked += 1
+        else:
+            c.store_track_status(trackid, True)
+    return dead, relinked
+
+
+@click.command()
+@click.option(
+    "--credentials", "-c",
+    metavar="<credentials_json_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
+    help="Path where to store credentials.",
+)
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.option(
+    "--chunks", "-n",
+    type=click.INT,
+    help="Stop after checking this many chunks of 50 tracks",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Start from the beginning instead of resuming the last run",
+)
+@profiling.profile_options
+def revalidate(credentials, cache, chunks, restart):
+    """
+    Check that matched Spotify tracks in the cache are still available.
+
+    Unavailable tracks are removed from the cache and queued for a new
+    search, relinked tracks are replaced by the new track. The run can be
+    interrupted at any time and it resumes where it stopped.
+    """
+    sp = Spotify(credfile=credentials, anonymous=True)
+    c = Cache(cache)
+    after = "" if restart else c.get_meta("revalidate_cursor", "")
+    checked, dead, relinked = 0, 0, 0
+    with profiling.section("revalidate"):
+        while chunks is None or chunks > 0:
+            trackids = c.get_matched_spotify_ids(after, 50)
+            if not trackids:
+                after = ""
+                click.secho("All cached matches checked.", bold=True)
+                break
+            d, r = revalidate_chunk(sp, c, trackids)
+            checked, dead, relinked = (
+                checked + len(trackids), dead + d, relinked + r,
+            )
+            after = trackids[-1]
+            c.set_meta("revalidate_cursor", after)
+            print(
+                f"Checked: {checked:6} Dead: {dead:4} Relinked: {relinked:4}",
+            )
+            if chunks is not None:
+                chunks -= 1
+    c.set_meta("revalidate_cursor", after)
@@ -0,0 +1,195 @@
+import gzip
+import json
+from pathlib import Path
+from operator import itemgetter
+from itertools import islice, groupby
+
+import click
+from yaml import safe_load
+
+from . import profiling
+from .cache import Cache, SNAPSHOT_TABLES
+
+FORMAT = "spotzurnal-cache-snapshot"
+VERSION = 1
+
+
+class SnapshotWriter:
+    """
+    Write cache snapshot as gzipped JSON lines, optionally split into
+    more files of at most `max_rows` rows each.
+
+    Every file starts with a header line, every table with a line naming
+    it and its columns, followed by one JSON array per row.
+    """
+
+    def __init__(self, path, max_rows=None):
+        self.path = Path(path)
+        self.max_rows = max_rows
+        self.files = []
+        self.f = None
+        self.rows = 0
+        self.table = None
+
+    def _open(self):
+        if self.f:
+            self.f.close()
+        if self.max_rows:
+            name = self.path.name.split(".")[0]
+            suffix = "".join(self.path.suffixes)
+            p = self.path.with_name(f"{name}.{len(self.files):04}{suffix}")
+        else:
+            p = self.path
+        self.files.append(p)
+        self.f = gzip.open(p, "wt", encoding="utf-8")
+        self._writeline({"format": FORMAT, "version": VERSION})
+        self.rows = 0
+        if self.table:
+            self._writetable()
+
+    def _writeline(self, obj):
+        self.f.write(json.dumps(obj, ensure_ascii=False))
+        self.f.write("\n")
+
+    def _writetable(self):
+        self._writeline({
+            "table": self.table,
+            "columns": SNAPSHOT_TABLES[self.table],
+        })
+
+    def write_table(self, table, rows):
+        self.table = table
+        if self.f is None:
+            self._open()
+        else:
+            self._writetable()
+        for row in rows:
+            if self.max_rows and self.rows >= self.max_rows:
+                self._open()
+            self._writeline(row)
+            self.rows += 1
+
+    def close(self):
+        if self.f:
+            self.f.close()
+
+
+def read_snapshot(path):
+    """Yield (table, row) tuples from a snapshot file."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(next(f, "{}"))
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise click.ClickException(f"{path} is not a cache snapshot")
+        table = None
+        for line in f:
+            obj = json.loads(line)
+            if isinstance(obj, dict):
+                table = obj["table"]
+                if table not in SNAPSHOT_TABLES:
+                    raise click.ClickException(
+                        f"Unknown table {table} in {path}",
+                    )
+                if tuple(obj["columns"]) != SNAPSHOT_TABLES[table]:
+                    raise click.ClickException(
+                        f"Unexpected columns of {table} in {path}",
+                    )
+            else:
+                yield table, obj
+
+
+def import_snapshot(c, path, quirks=None, batch=10000):
+    """
+    Merge a snapshot file into the cache in batches. Return dictionary
+    of numbers of changed rows per table.
+    """
+    keep = set()
+    if quirks:
+        keep = {k for k, v in quirks.get("tracks", {}).items() if v}
+    changed = {}
+    for table, group in groupby(read_snapshot(path), key=itemgetter(0)):
+        rows = (r for _, r in group)
+        while True:
+            chunk = list(islice(rows, batch))
+            if not chunk:
+                break
+            changed[table] = changed.get(table, 0) + c.merge_rows(
+                table, chunk, keep,
+            )
+    return changed
+
+
+@click.command()
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.option(
+    "--max-rows",
+    type=click.INT,
+    help="Split the snapshot into files of at most this many rows",
+)
+@click.argument(
+    "output",
+    metavar="<snapshot_file>",
+    type=click.Path(dir_okay=False),
+)
+@profiling.profile_options
+def export(cache, max_rows, output):
+    """
+    Export matching data from the cache into a compressed snapshot.
+    """
+    c = Cache(cache)
+    w = SnapshotWriter(output, max_rows)
+    with profiling.section("cache-export"):
+        try:
+            for table in SNAPSHOT_TABLES:
+                w.write_table(table, c.iter_table(table))
+        finally:
+            w.close()
+    for f in w.files:
+        print(f)
+
+
+@click.command("import")
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache. (Created if necessary)",
+)
+@click.option(
+    "--quirks", "-q",
+    metavar="<quirks_yaml_file>",
+    show_default=True,
+    type=click.File(),
+    help="Path to hand-kept quirks file",
+)
+@click.argument(
+    "snapshots",
+    metavar="<snapshot_file>...",
+    type=click.Path(dir_okay=False, exists=True),
+    nargs=-1,
+    required=True,
+)
+@profiling.profile_options
+def import_(cache, quirks, snapshots):
+    """
+    Merge cache snapshots from other hosts into the cache.
+
+    Newer matches replace older ones. Tracks with a quirk keep their local
+    match.
+    """
+    c = Cache(cache)
+    q = safe_load(quirks) if quirks else None
+    for s in snapshots:
+        with profiling.section(f"cache-import-{Path(s).name}"):
+            changed = import_snapshot(c, s, q)
+        click.secho(s, bold=True)
+        for table, n in changed.items():
+            print(f"{table}: {n} rows changed")
@@ -59,15 +59,60 @@ def handle_oauth(credfile, username=None, scope=""):
     return username or creds["username"], token_info["access_token"]
 
 
+def handle_client_credentials(credfile):
+    """
+    Return client credentials manager for the App stored in credfile.
+    No user authorization is needed, so the client can only access public
+    data like search.
+    """
+    try:
+        with open(credfile) as f:
+            creds = json.load(f)
+    except IOError:
+        creds = {}
+    if "client_id" not in creds or "client_secret" not in creds:
+        raise click.ClickException(
+            f"Client ID and Client Secret missing in {credfile}",
+        )
+    return oauth2.SpotifyClientCredentials(
+        client_id=creds["client_id"],
+        client_secret=creds["client_secret"],
+    )
+
+
+def get_accounts(credfiles, usernames=()):
+    """
+    Return list of authenticated Spotify clients, one for each credentials
+    file. User names are paired with credentials files in order.
+    """
+    if len(usernames) > len(credfiles):
+        raise click.UsageError("More user names than credentials given")
+    usernames = list(usernames) + [None] * (len(credfiles) - len(usernames))
+    return [
+        Spotify(username=u, credfile=c)
+        for c, u in zip(credfiles, usernames)
+    ]
+
+
 class Spotify(spotipy.Spotify):
     def __init__(
         self,
         credfile="clientid.json",
         username=None,
         scope="playlist-modify-public",
+        anonymous=False,
     ):
-        self.user, token = handle_oauth(credfile, username, scope)
-        super().__init__(auth=token)
+        self.search_calls = 0
+        if anonymous:
+            self.user = None
+            super().__init__(
+                client_credentials_manager=handle_client_credentials(
+                    credfile,
+                ),
+            )
+        else:
+            self.user, token = handle_oauth(credfile, username, scope)
+            super().__init__(auth=token)
 
     def add_tracks_to_playlist(
         self, trackids, username="0skat-cz",
@@ -77,6 +122,10 @@ class Spotify(spotipy.Spotify):
             trackids = [trackids, ]
         self.user_playlist_add_tracks(username, playlistid, trackids)
 
+    def search(self, *args, **kwargs):
+        self.search_calls += 1
+        return super().search(*args, **kwargs)
+
     def get_all_data(self, func, *args, **kwargs):
         r = func(*args, **kwargs)
         yield from r["items"]
@@ -86,16 +135,34 @@ class Spotify(spotipy.Spotify):
 
     @staticmethod
     def put_all_data(func, data, *args, limit=100, offset=0, **kwargs):
+        """Call func for chunks of data, return the last response."""
+        r = None
         for i in range(offset, len(data), limit):
-            func(*args, data[i:i + limit], **kwargs)
+            r = func(*args, data[i:i + limit], **kwargs)
+        return r
+
+    def get_playlist_index(self):
+        """Return dictionary mapping names of user playlists to their ids."""
+        index = {}
+        for p in self.get_all_data(self.current_user_playlists, limit=50):
+            index.setdefault(p["name"], p["id"])
+        return index
 
-    def get_or_create_playlist(self, name, description=""):
-        playlists = self.get_all_data(self.current_user_playlists, limit=50)
-        for p in playlists:
-            if p["name"] == name:
-                return p["id"]
+    def get_or_create_playlist(self, name, description="", index=None):
+        if index is None:
+            playlists = self.get_all_data(
+                self.current_user_playlists,
+                limit=50,
+            )
+            for p in playlists:
+                if p["name"] == name:
+                    return p["id"]
+        elif name in index:
+            return index[name]
         r = self.user_playlist_create(
             self.user,
             name,
         )
+        if index is not None:
+            index[name] = r["id"]
         return r["id"]
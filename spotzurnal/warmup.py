@@ -0,0 +1,104 @@
+import time
+from pathlib import Path
+
+import click
+from yaml import safe_load
+
+from . import matcher
+from . import profiling
+from .spotify import Spotify
+from .cache import Cache
+
+# search_spotify_track() does at most this many searches per track
+SEARCHES_PER_TRACK = 3
+
+
+@click.command()
+@click.option(
+    "--credentials", "-c",
+    metavar="<credentials_json_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "credentials.json"),
+    help="Path where to store credentials.",
+)
+@click.option(
+    "--cache",
+    metavar="<cache_sqlite_file>",
+    show_default=True,
+    type=click.Path(dir_okay=False, exists=True),
+    default=str(Path(click.get_app_dir("spotzurnal")) / "cache.sqlite"),
+    help="Path to SQLite cache.",
+)
+@click.option(
+    "--quirks", "-q",
+    metavar="<quirks_yaml_file>",
+    show_default=True,
+    type=click.File(),
+    help="Path to hand-kept quirks file",
+)
+@click.option(
+    "--budget", "-b",
+    type=click.INT,
+    default=300,
+    show_default=True,
+    help="Maximum number of Spotify search calls",
+)
+@click.option(
+    "--max-time", "-t",
+    type=click.FLOAT,
+    help="Stop after this many minutes",
+)
+@click.option(
+    "--retry-days",
+    type=click.FLOAT,
+    default=7,
+    show_default=True,
+    help="Do not search again for tracks not found in this many days",
+)
+@profiling.profile_options
+def warmup(credentials, cache, quirks, budget, max_time, retry_days):
+    """
+    Search for unmatched tracks in the cache, the most played ones first,
+    within a fixed budget of Spotify API calls. Tracks queued by
+    spotzurnal-revalidate, whose matches became unplayable, go first.
+    """
+    sp = Spotify(credfile=credentials, anonymous=True)
+    c = Cache(cache)
+    q = safe_load(quirks) if quirks else {"artists": {}, "tracks": {}}
+    now = time.time()
+    deadline = now + max_time * 60 if max_time else None
+    tracks = list(
+        c.get_unmatched_tracks(
+            searched_before=now - retry_days * 86400,
+            queued_first=True,
+        ),
+    )
+    searched, found = 0, 0
+    with profiling.section("warmup"):
+        for track in tracks:
+            if sp.search_calls + SEARCHES_PER_TRACK > budget:
+                break
+            if deadline and time.time() > deadline:
+                break
+            if matcher.get_track_quirk(q, track.track_id):
+                continue
+            print(f"{track.interpret} - {track.track}")
+            interpret = (
+                matcher.get_artist_quirk(q, track.interpret_id)
+                or track.interpret
+            )
+            t = matcher.search_spotify_track(
+                sp, interpret, track.track, cache=c,
+            )
+            searched += 1
+            if t:
+                c.store_spotify_track(t, track)
+                found += 1
+            else:
+                c.store_unmatched(track, interpret)
+    click.secho(
+        f"Found {found}/{searched} tracks "
+        f"using {sp.search_calls} search calls.",
+        bold=True,
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import datetime
+
+from spotzurnal import aio
+from spotzurnal import croapi
+from spotzurnal.cache import Cache
+from spotzurnal.records import PlaylistItem
+from spotzurnal.spotify import Spotify
+
+DATE = datetime.date(2019, 1, 31)
+
+
+def get_day_playlist(station="radiozurnal", date=None):
+    start = datetime.datetime.combine(date, datetime.time(10))
+    # Three tracks aired four times each, track 3 cannot be found
+    for n, t in enumerate([1, 2, 3] * 4):
+        yield PlaylistItem(
+            start + datetime.timedelta(minutes=4 * n),
+            f"Interpret {t}", 100 + t,
+            f"Track {t}", t,
+            {},
+        )
+
+
+class FakeSpotify(Spotify):
+    user = "alice"
+
+    def __init__(self):
+        self.queries = []
+        self.playlists = {}
+        self.listings = 0
+
+    def search(self, q, **kwargs):
+        self.queries.append(q)
+        if "3" in q:
+            return {"tracks": {"items": []}}
+        t = q.split()[-1]
+        return {"tracks": {"items": [{
+            "id": f"{t:0>22}",
+            "name": f"Track {t}",
+            "artists": [{"id": "artist", "name": f"Interpret {t}"}],
+        }]}}
+
+    def current_user_playlists(self, limit=50):
+        self.listings += 1
+        return {
+            "items": [{"name": n, "id": n} for n in self.playlists],
+            "next": None,
+        }
+
+    def user_playlist_create(self, user, name):
+        self.playlists.setdefault(name, [])
+        return {"id": name}
+
+    def user_playlist_tracks(self, user, playlist, fields=None):
+        return {"total": len(self.playlists[playlist])}
+
+    def user_playlist_add_tracks(self, user, playlist, tracks):
+        self.playlists[playlist].extend(tracks)
+        return {"snapshot_id": "added"}
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_repeated_plays_searched_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(croapi, "get_cro_day_playlist", get_day_playlist)
+    sp = FakeSpotify()
+    c = Cache(tmp_path / "cache.sqlite")
+
+    result = run(aio.plan_cro_playlist(sp, DATE, "dvojka", c))
+
+    # One search for each found track, two attempts for the missing one
+    assert len(sp.queries) == 2 + 2
+    assert result.trackids == [f"{t:0>22}" for t in "12" * 4]
+    assert len(result.unmatched) == 4
+    assert result.fromcache == 6
+    assert c.get_plan("dvojka", DATE) == [
+        (i.track_id, m) for i, m in zip(result.items, result.matches)
+    ]
+
+
+def test_playlist_index_reused(tmp_path, monkeypatch):
+    monkeypatch.setattr(croapi, "get_cro_day_playlist", get_day_playlist)
+    sp = FakeSpotify()
+    c = Cache(tmp_path / "cache.sqlite")
+    indexes = {}
+
+    for d in range(3):
+        date = DATE + datetime.timedelta(days=d)
+        result, playlists = run(aio.match_cro_playlist(
+            sp, date, "dvojka", cache=c, indexes=indexes,
+        ))
+        assert sp.playlists[playlists["alice"]] == result.trackids
+
+    assert sp.listings == 1
+    assert len(indexes["alice"]) == 3
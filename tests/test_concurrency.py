@@ -0,0 +1,159 @@
+import re
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from spotzurnal import croapi
+from spotzurnal import matcher
+from spotzurnal.cache import Cache
+from spotzurnal.records import PlaylistItem
+from spotzurnal.spotify import Spotify
+
+STATIONS = ["radiozurnal", "dvojka", "radiowave", "brno"]
+DAYS = 14
+TRACKS = 60
+TRACKS_PER_DAY = 40
+
+
+def spotify_id(n):
+    return f"{n:022d}"
+
+
+def get_day_playlist(station="radiozurnal", date=None):
+    """
+    Fake CRo playlist of a station-day. Tracks are drawn from a pool shared
+    by all station-days, so that workers store and match the same tracks.
+    """
+    start = datetime.datetime.combine(date, datetime.time())
+    seed = date.toordinal() * len(STATIONS) + STATIONS.index(station)
+    for n in range(TRACKS_PER_DAY):
+        t = (seed + 7 * n) % TRACKS
+        yield PlaylistItem(
+            start + datetime.timedelta(minutes=4 * n),
+            f"Interpret {t}", 1000 + t,
+            f"Track {t}", t,
+            {},
+        )
+
+
+class FakeSpotify(Spotify):
+    def __init__(self, user):
+        self.user = user
+        self.search_calls = 0
+        self.playlists = {}
+        self.lock = threading.Lock()
+
+    def search(self, q, **kwargs):
+        with self.lock:
+            self.search_calls += 1
+        time.sleep(0.001)
+        m = re.search(r"artist:interpret (\d+) track:track (\d+)", q)
+        if not m:
+            return {"tracks": {"items": []}}
+        a, t = m.groups()
+        return {"tracks": {"items": [{
+            "id": spotify_id(int(t)),
+            "name": f"Track {t}",
+            "artists": [{"id": spotify_id(1000 + int(a)),
+                         "name": f"Interpret {a}"}],
+        }]}}
+
+    def current_user_playlists(self, limit=50):
+        with self.lock:
+            return {
+                "items": [
+                    {"name": name, "id": name}
+                    for name in self.playlists
+                ],
+                "next": None,
+            }
+
+    def user_playlist_create(self, user, name):
+        with self.lock:
+            self.playlists.setdefault(name, [])
+        return {"id": name}
+
+    def user_playlist_replace_tracks(self, user, playlist, tracks):
+        with self.lock:
+            self.playlists[playlist] = list(tracks)
+        return {"snapshot_id": f"{playlist}-{len(tracks)}"}
+
+    def user_playlist_tracks(self, user, playlist, fields=None):
+        with self.lock:
+            return {"total": len(self.playlists[playlist])}
+
+    def user_playlist_add_tracks(self, user, playlist, tracks):
+        with self.lock:
+            self.playlists[playlist].extend(tracks)
+            total = len(self.playlists[playlist])
+        return {"snapshot_id": f"{playlist}-{total}"}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(croapi, "get_cro_day_playlist", get_day_playlist)
+    return Cache(tmp_path / "cache.sqlite")
+
+
+def station_days():
+    first = datetime.date(2019, 1, 1)
+    return [
+        (station, first + datetime.timedelta(days=d))
+        for d in range(DAYS)
+        for station in STATIONS
+    ]
+
+
+def run_parallel(func, jobs, workers=8):
+    with ThreadPoolExecutor(workers) as ex:
+        futures = [ex.submit(func, *job) for job in jobs]
+    # Re-raise any exception of the workers
+    return [f.result() for f in futures]
+
+
+def test_many_station_days(cache):
+    accounts = [FakeSpotify("alice"), FakeSpotify("bob")]
+    jobs = station_days()
+
+    def work(station, date):
+        matcher.match_cro_playlist(
+            accounts, date, station, replace=True, cache=cache,
+        )
+
+    run_parallel(work, jobs)
+
+    for station, date in jobs:
+        expected = [
+            (i.track_id, spotify_id(i.track_id))
+            for i in get_day_playlist(station, date)
+        ]
+        assert cache.get_plan(station, date) == expected
+        plname = matcher.get_plname(station, date)
+        for a in accounts:
+            assert a.playlists[plname] == [s for _, s in expected]
+    assert set(cache.get_plans()) == set(jobs)
+    for a in accounts:
+        assert list(cache.get_pending_plans(a.user)) == []
+    played = cache.con.execute("SELECT COUNT(*) FROM cro_plays").fetchone()
+    assert played[0] == len(jobs) * TRACKS_PER_DAY
+    assert list(cache.get_unmatched_tracks()) == []
+
+
+def test_same_station_day(cache):
+    # Workers racing on the very same plan must leave it complete
+    sp = FakeSpotify("alice")
+    station, date = STATIONS[0], datetime.date(2019, 1, 1)
+
+    def work(station, date):
+        return matcher.plan_cro_playlist(sp, date, station, cache)
+
+    results = run_parallel(work, [(station, date)] * 16)
+
+    expected = [
+        spotify_id(i.track_id) for i in get_day_playlist(station, date)
+    ]
+    assert all(r == expected for r in results)
+    assert [s for _, s in cache.get_plan(station, date)] == expected
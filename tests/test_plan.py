@@ -0,0 +1,52 @@
+import datetime
+
+from spotzurnal import plan
+from spotzurnal.cache import Cache
+from spotzurnal.spotify import Spotify
+
+STATION, DATE = "radiozurnal", datetime.date(2019, 1, 31)
+
+
+class FakeSpotify(Spotify):
+    def __init__(self, user):
+        self.user = user
+        self.playlists = {}
+
+    def current_user_playlists(self, limit=50):
+        return {
+            "items": [{"name": n, "id": n} for n in self.playlists],
+            "next": None,
+        }
+
+    def user_playlist_create(self, user, name):
+        self.playlists.setdefault(name, [])
+        return {"id": name}
+
+    def user_playlist_replace_tracks(self, user, playlist, tracks):
+        self.playlists[playlist] = list(tracks)
+        return {"snapshot_id": "replaced"}
+
+    def user_playlist_tracks(self, user, playlist, fields=None):
+        return {"total": len(self.playlists[playlist])}
+
+    def user_playlist_add_tracks(self, user, playlist, tracks):
+        self.playlists[playlist].extend(tracks)
+        return {"snapshot_id": "added"}
+
+
+def test_changed_plan_replaces_playlist(tmp_path):
+    c = Cache(tmp_path / "cache.sqlite")
+    sp = FakeSpotify("alice")
+
+    c.store_plan(STATION, DATE, [(1, "a"), (2, None), (3, "c")])
+    plan.apply_pending(sp, c)
+    [playlist] = sp.playlists.values()
+    assert playlist == ["a", "c"]
+
+    # A track in the middle of the plan has been matched since
+    c.store_plan(STATION, DATE, [(1, "a"), (2, "b"), (3, "c")])
+    assert list(c.get_pending_plans("alice")) == [(STATION, DATE)]
+    plan.apply_pending(sp, c)
+    [playlist] = sp.playlists.values()
+    assert playlist == ["a", "b", "c"]
+    assert list(c.get_pending_plans("alice")) == []
@@ -0,0 +1,79 @@
+"""
+Benchmark of record creation. Run as a script for the per-row cost on
+100k rows, the test runs a smaller sample.
+"""
+import datetime
+import timeit
+from collections import namedtuple
+
+from spotzurnal.records import PlaylistItem, Track, make_playlist_item
+
+
+def api_items(n):
+    since = datetime.datetime(2019, 1, 31, 10)
+    return [
+        {
+            "since": since,
+            "interpret": f"Interpret {i}",
+            "interpret_id": i,
+            "track": f"Track {i}",
+            "track_id": i,
+        }
+        for i in range(n)
+    ]
+
+
+def cache_rows(n):
+    return [(i, f"Track {i}", i, f"Interpret {i}") for i in range(n)]
+
+
+def class_per_item(items):
+    return [namedtuple("PlaylistItem", i.keys())(**i) for i in items]
+
+
+def shared_item(items):
+    return [make_playlist_item(i) for i in items]
+
+
+def class_per_row(rows):
+    fields = Track._fields
+    return [namedtuple("Track", fields)(*r) for r in rows]
+
+
+def shared_row(rows):
+    return [Track._make(r) for r in rows]
+
+
+def benchmark(n):
+    """Return dictionary of per-row costs in seconds."""
+    items, rows = api_items(n), cache_rows(n)
+    return {
+        name: timeit.timeit(lambda: func(data), number=1) / n
+        for name, func, data in (
+            ("namedtuple class per API item", class_per_item, items),
+            ("PlaylistItem via make_playlist_item", shared_item, items),
+            ("namedtuple class per cache row", class_per_row, rows),
+            ("Track._make", shared_row, rows),
+        )
+    }
+
+
+def test_shared_records_are_cheaper():
+    cost = benchmark(2000)
+    assert (
+        cost["PlaylistItem via make_playlist_item"] * 10
+        < cost["namedtuple class per API item"]
+    )
+    assert cost["Track._make"] * 10 < cost["namedtuple class per cache row"]
+
+
+def test_make_playlist_item_keeps_unknown_fields():
+    i = make_playlist_item({"since": None, "track": "T", "new": 1})
+    assert i == PlaylistItem(None, None, None, "T", None, {"new": 1})
+
+
+if __name__ == "__main__":
+    n = 100000
+    print(f"Per-row cost on {n} rows:")
+    for name, seconds in benchmark(n).items():
+        print(f"  {name:36} {seconds * 1e6:8.2f} µs")
@@ -0,0 +1,62 @@
+import time
+import datetime
+
+from spotzurnal import matcher
+from spotzurnal.cache import Cache
+from spotzurnal.records import PlaylistItem
+
+SINCE = datetime.datetime(2019, 1, 31, 10)
+
+
+def item(n):
+    return PlaylistItem(SINCE, f"Interpret {n}", n, f"Track {n}", n, {})
+
+
+def spotify_track(track_id, n):
+    return {
+        "id": track_id,
+        "name": f"Track {n}",
+        "artists": [{"id": "artist", "name": f"Interpret {n}"}],
+    }
+
+
+class FakeSpotify:
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, q, **kwargs):
+        return {"tracks": {"items": self.results}}
+
+
+def test_dead_match_is_searched_again(tmp_path):
+    c = Cache(tmp_path / "cache.sqlite")
+    dead, popular = item(1), item(2)
+    for i in (dead, popular):
+        c.store_cro_track(i)
+    c.store_plays("radiozurnal", [dead])
+    c.store_plays("dvojka", [
+        popular, popular._replace(since=SINCE + datetime.timedelta(hours=1)),
+    ])
+    c.store_spotify_track(spotify_track("D" * 22, 1), dead)
+    c.store_unmatched(popular, popular.interpret)
+
+    c.store_track_status("D" * 22, False)
+    assert c.lookup_match(dead) is None
+
+    # The queued track goes first, recently searched ones are held back
+    tracks = c.get_unmatched_tracks(
+        searched_before=time.time() - 3600, queued_first=True,
+    )
+    assert [t.track_id for t in tracks] == [1]
+    tracks = c.get_unmatched_tracks(queued_first=True)
+    assert [t.track_id for t in tracks] == [1, 2]
+    assert [t.track_id for t in c.get_unmatched_tracks()] == [2, 1]
+
+    # The unplayable track is skipped even if it is the best candidate
+    sp = FakeSpotify([
+        spotify_track("D" * 22, 1), spotify_track("E" * 22, 1),
+    ])
+    quirks = {"tracks": {}, "artists": {}}
+    assert matcher.match_track(sp, dead, c, quirks) == ("E" * 22, False)
+    assert c.lookup_match(dead) == "E" * 22
+    assert list(c.get_unmatched_tracks(queued_first=True))[0].track_id == 2
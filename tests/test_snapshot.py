@@ -0,0 +1,53 @@
+import datetime
+
+from spotzurnal import snapshot
+from spotzurnal.cache import Cache, SNAPSHOT_TABLES
+from spotzurnal.records import PlaylistItem
+
+SINCE = datetime.datetime(2019, 1, 31, 10)
+DEAD, OLD, NEW = "D" * 22, "O" * 22, "N" * 22
+
+
+def item(n):
+    return PlaylistItem(SINCE, f"Interpret {n}", n, f"Track {n}", n, {})
+
+
+def spotify_track(track_id):
+    return {
+        "id": track_id,
+        "name": "Track",
+        "artists": [{"id": "artist", "name": "Interpret"}],
+    }
+
+
+def matched_cache(path):
+    c = Cache(path)
+    c.store_spotify_track(spotify_track(DEAD), item(1))
+    c.store_spotify_track(spotify_track(OLD), item(2))
+    return c
+
+
+def export(c, path):
+    w = snapshot.SnapshotWriter(path)
+    for table in SNAPSHOT_TABLES:
+        w.write_table(table, c.iter_table(table))
+    w.close()
+
+
+def test_imported_status_changes_matches(tmp_path):
+    a = matched_cache(tmp_path / "a.sqlite")
+    b = matched_cache(tmp_path / "b.sqlite")
+
+    # Host A revalidates its matches and shares the results
+    a.store_track_status(DEAD, False)
+    a.store_track_status(OLD, True, NEW, spotify_track(NEW))
+    export(a, tmp_path / "a.jsonl.gz")
+    snapshot.import_snapshot(b, tmp_path / "a.jsonl.gz")
+
+    assert b.lookup_match(item(1)) is None
+    queued = b.con.execute(
+        "SELECT cro_track_id, spo_track_id FROM research_queue",
+    )
+    assert [tuple(r) for r in queued] == [(1, DEAD)]
+    assert b.lookup_match(item(2)) == NEW
+    assert b.get_unplayable([DEAD, OLD, NEW]) == {DEAD}